@@ -1,135 +1,291 @@
 from flask import Flask, request, jsonify
-from flask_caching import Cache
-import pandas as pd
-from sklearn.linear_model import LinearRegression
-import yfinance as yf
-import humanize
+from lazy import lazy_import
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from bar_store import bar_store
+import market_hours
+from cache_layer import CacheFamily, SWRCache, configure_cache
+from benchmarks import BenchmarkCache, resolve_benchmark
+from forecast import ForecastStore, model_storage
+import fundamentals
+from fundamentals import fundamentals_store
+import metrics
+import compression
+from chart_payload import (
+    PayloadError, parse_options, parse_points, downsample_indices, encode_series, encode_times
+)
+from metrics import register_cache
+import upstream
+from upstream import scheduler, yf
+
+# Heavy libraries load on first use so /testbackend and cache hits start fast
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+humanize = lazy_import('humanize')
+
+# LOG_LEVEL=DEBUG for verbose output; WARNING keeps production logs quiet
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Configure cache
-app.config['CACHE_TYPE'] = 'SimpleCache'
-app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes
+# Request latency by route, upstream and cache counters at /metrics
+metrics.install(app)
+
+# Configure cache (shared by all worker processes; set CACHE_TYPE=RedisCache
+# and CACHE_REDIS_URL to share across hosts)
+cache = configure_cache(app)
+
+# Forecast models live in the shared cache so every instance and the batch
+# trainer (python forecast.py) read and write the same ones
+forecast_store = ForecastStore(model_storage(cache))
+
+# Fresh and stale-but-servable lifetimes per key family. Price-derived
+# families use their fresh lifetime during a session and stay fresh until the
+# next open once the market closes; statements stay fresh until the
+# fundamentals store would next check for a new quarter.
+swr_cache = SWRCache(cache, [
+    CacheFamily('dashboard', fresh=300, stale=86400, refresh_ahead=True,
+                is_complete=lambda data: all(status == 'ok' for status in data['section_status'].values()),
+                expires=lambda data: market_hours.session_ttl(300)),
+    CacheFamily('forecast', fresh=3600, stale=86400,
+                expires=lambda forecast: market_hours.session_ttl(3600)),
+    CacheFamily('fundamentals', fresh=86400, stale=7 * 86400,
+                expires=lambda summary: max(summary['expires_at'] - time.time(), 60)),
+])
+# Keep frequently viewed dashboards refreshed before they go stale
+register_cache('swr', swr_cache.stats)
+swr_cache.start_refresh_ahead(interval=int(os.getenv('CACHE_REFRESH_AHEAD_INTERVAL', '30')))
 
-cache = Cache(app)
+# Benchmark index series shared across all compared symbols
+benchmark_cache = BenchmarkCache(refresh_interval=int(os.getenv('BENCHMARK_REFRESH', '300')))
+benchmark_cache.start()
+
+# Pool for loading several symbols' history at once
+history_executor = ThreadPoolExecutor(max_workers=int(os.getenv('HISTORY_FETCH_WORKERS', '8')))
+
+# Pool and per-request deadline for the dashboard's independent upstream calls
+dashboard_executor = ThreadPoolExecutor(max_workers=int(os.getenv('DASHBOARD_FETCH_WORKERS', '12')))
+DASHBOARD_PART_TIMEOUT = float(os.getenv('DASHBOARD_PART_TIMEOUT', '8'))
+
+# Let callers revalidate cached JSON with If-None-Match, and compress it
+compression.install(app)
 
 # Helper: Price Forecast
 
-@cache.memoize(timeout=3600) # Cache for 1 hour
+@swr_cache.cached('forecast')
 def get_price_forecast(symbol):
+    """Look up the persisted next-day forecast, updating the model only when new bars exist"""
     try:
-        stock = yf.Ticker(symbol)
-        df = stock.history(period="2y")
-        if df.empty:
-            return None
-        df["Target"] = df["Close"].shift(-1)
-        df = df.dropna()  # FIX: remove inplace=True and assign result
-        features = ['Open','High','Low','Close','Volume']
-        X = df[features]
-        y = df["Target"]
-        model = LinearRegression()
-        model.fit(X, y)
-        last_day_features = df[features].iloc[-1:]
-        forecast = model.predict(last_day_features)
-        return forecast[0]
+        return forecast_store.forecast(symbol)
     except Exception as e:
-        print(f"Error in get_price_forecast for {symbol}: {str(e)}")
+        logger.warning("Error in get_price_forecast for %s: %s", symbol, e)
         return None
 
-# Helper: Income Grid
-
-def create_income_grid_data(df):
-    income_items = []
-    latest_quarter = df.columns[0] if len(df.columns) > 0 else None
-    if latest_quarter is None:
-        return income_items
-    positive_items = ['Total Revenue', 'Gross Profit', 'Operating Income', 'Net Income',
-                     'Interest Income', 'Other Income Expense', 'Pretax Income']
-    negative_items = ['Total Expenses', 'Operating Expense', 'Cost Of Revenue',
-                     'Interest Expense', 'Tax Provision', 'Research And Development',
-                     'Selling General And Administration']
-    for index, row in df.iterrows():
-        if pd.isna(row[latest_quarter]) or row[latest_quarter] == 0:
-            continue
-        value = row[latest_quarter]
-        css_class = ""
-        if any(pos_item.lower() in str(index).lower() for pos_item in positive_items):
-            css_class = "positive"
-        elif any(neg_item.lower() in str(index).lower() for neg_item in negative_items):
-            css_class = "negative"
-        if isinstance(value, (int, float)):
-            if abs(value) >= 1e9:
-                formatted_value = f"${value/1e9:.2f}B"
-            elif abs(value) >= 1e6:
-                formatted_value = f"${value/1e6:.2f}M"
-            elif abs(value) >= 1e3:
-                formatted_value = f"${value/1e3:.2f}K"
-            else:
-                formatted_value = f"${value:.2f}"
-        else:
-            formatted_value = str(value)
-        income_items.append({
-            'label': str(index).replace('_', ' ').title(),
-            'value': formatted_value,
-            'css_class': css_class,
-            'raw_value': value
-        })
-    return income_items
-
 # Endpoint: Comparison
 @app.route('/api/comparison/<symbol>', methods=['GET'])
 def get_comparison_data(symbol):
     period = request.args.get('period', '1y')
-    data, error, status_code = get_comparison_data_for_period(symbol, period)
+    benchmark = request.args.get('benchmark', '^GSPC')
+    try:
+        compact, encoding, fields = parse_options(request.args, COMPARISON_FIELDS, COMPARISON_FIELDS)
+        points = parse_points(request.args)
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), 400
+    data, error, status_code = get_comparison_data_for_period(
+        symbol, period, benchmark, compact=compact, encoding=encoding, fields=fields, points=points)
     if error:
         return jsonify({'error': error}), status_code
     return jsonify(data)
 
-def get_comparison_data_for_period(symbol,period):
+# Series a comparison response can include; the summary values are always sent
+COMPARISON_FIELDS = ('dates', 'stock_prices', 'stock_performance', 'sp500_performance')
+
+def get_comparison_data_for_period(symbol,period,benchmark='^GSPC',compact=False,encoding='delta',fields=COMPARISON_FIELDS,points=None):
     try:
         interval = get_interval_for_period(period)
         if not interval:
             return None, "Invalid period specified", 400
+        benchmark_symbol = resolve_benchmark(benchmark)
+        if not benchmark_symbol:
+            return None, "Invalid benchmark specified", 400
         
-        stock_hist = yf.Ticker(symbol).history(period=period,interval=interval)
-        sp500_hist = yf.Ticker("^GSPC").history(period=period,interval=interval)
-        if stock_hist.empty or sp500_hist.empty:
-            return None
+        stock_hist = bar_store.history(symbol, period=period, interval=interval)
+        bench = benchmark_cache.get(benchmark_symbol, period, interval)
+        if stock_hist.empty or bench.close.empty:
+            return None, "No data available for this period", 404
         combined_df = pd.DataFrame({
             'stock': stock_hist['Close'],
-            'sp500': sp500_hist['Close']
+            'benchmark': bench.close
         })
         combined_df.ffill(inplace=True)
         combined_df.dropna(inplace=True)
         if combined_df.empty:
-            return None
-        performance_df = (combined_df / combined_df.iloc[0] - 1) * 100
+            return None, "No overlapping data for this period", 404
+        stock_performance = (combined_df['stock'] / combined_df['stock'].iloc[0] - 1) * 100
+
+        # Rebase the precomputed benchmark series to the first aligned bar
+        bench_growth = 1 + bench.performance.reindex(combined_df.index, method='ffill') / 100
+        benchmark_performance = (bench_growth / bench_growth.iloc[0] - 1) * 100
+
+        if points:
+            # Keep the extremes of both lines on the same shared dates
+            rows = downsample_indices(np.column_stack([combined_df['stock'], benchmark_performance]), points)
+            combined_df = combined_df.iloc[rows]
+            stock_performance = stock_performance.iloc[rows]
+            benchmark_performance = benchmark_performance.iloc[rows]
 
         stock_start_price = float(stock_hist['Close'].iloc[0])
         stock_end_price = float(stock_hist['Close'].iloc[-1])
         price_change = stock_end_price - stock_start_price
         price_change_percent = (price_change / stock_start_price) * 100 if stock_start_price != 0 else 0
-        if period == '1d' or period == '5d':
-            dates = performance_df.index.strftime('%m-%d %H:%M').tolist()
-        else:
-            dates = performance_df.index.strftime('%Y-%m-%d').tolist()
 
         data = {
-            "dates" : dates,
-            "stock_prices" : stock_hist['Close'].round(2).tolist(),
             "price_change" : round(price_change, 2),
             "price_change_percent" : round(price_change_percent, 2),
-            "stock_performance": performance_df['stock'].round(2).tolist(),
-            "sp500_performance": performance_df['sp500'].round(2).tolist(),
             "end_price" : round(float(stock_hist['Close'].iloc[-1]), 2),
             'stock_symbol': symbol.upper(),
-            'sp500_symbol': 'S&P 500'
+            'sp500_symbol': bench.name,
+            'benchmark_symbol': benchmark_symbol
+        }
+        # Prices come from the aligned frame so every series matches the dates
+        series = {
+            'stock_prices': combined_df['stock'],
+            'stock_performance': stock_performance,
+            'sp500_performance': benchmark_performance
         }
+        if compact:
+            if 'dates' in fields:
+                data.update(encode_times(combined_df.index))
+            for name, values in series.items():
+                if name in fields:
+                    data[name] = encode_series(values.to_numpy(), encoding)
+        else:
+            if 'dates' in fields:
+                if period == '1d' or period == '5d':
+                    data['dates'] = combined_df.index.strftime('%m-%d %H:%M').tolist()
+                else:
+                    data['dates'] = combined_df.index.strftime('%Y-%m-%d').tolist()
+            for name, values in series.items():
+                if name in fields:
+                    data[name] = values.round(2).tolist()
 
         return (data,None,200)
 
     except Exception as e:
-        print(f"Error in get_comparison_data_for_period for {symbol} ({period}): {str(e)}")
+        logger.exception("Error in get_comparison_data_for_period for %s (%s)", symbol, period)
+        return None, str(e), 500
+
+# Endpoint: Multi-symbol comparison
+MAX_COMPARISON_SYMBOLS = 25
+
+@app.route('/api/comparison', methods=['GET'])
+def get_multi_comparison_data():
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return jsonify({'error': 'No symbols provided'}), 400
+    if len(symbols) > MAX_COMPARISON_SYMBOLS:
+        return jsonify({'error': f'At most {MAX_COMPARISON_SYMBOLS} symbols can be compared'}), 400
+    period = request.args.get('period', '1y')
+    benchmark = request.args.get('benchmark', '^GSPC')
+    try:
+        points = parse_points(request.args)
+    except PayloadError as e:
+        return jsonify({'error': str(e)}), 400
+    data, error, status_code = get_multi_comparison_for_period(symbols, period, benchmark, points)
+    if error:
+        return jsonify({'error': error}), status_code
+    return jsonify(data)
+
+def get_multi_comparison_for_period(symbols, period, benchmark='^GSPC', points=None):
+    try:
+        interval = get_interval_for_period(period)
+        if not interval:
+            return None, "Invalid period specified", 400
+        benchmark_symbol = None
+        if benchmark and benchmark.lower() != 'none':
+            benchmark_symbol = resolve_benchmark(benchmark)
+            if not benchmark_symbol:
+                return None, "Invalid benchmark specified", 400
+
+        # Fetch every series concurrently; most are served from the bar store
+        futures = {symbol: upstream.submit(history_executor, bar_store.history, symbol, period, interval)
+                   for symbol in symbols}
+        closes = {}
+        missing = []
+        for symbol, future in futures.items():
+            try:
+                hist = future.result()
+            except Exception as e:
+                logger.warning("Error fetching history for %s: %s", symbol, e)
+                hist = None
+            if hist is None or hist.empty:
+                missing.append(symbol)
+            else:
+                closes[symbol] = hist['Close']
+        if not closes:
+            return None, "No data available for this period", 404
+
+        bench = benchmark_cache.get(benchmark_symbol, period, interval) if benchmark_symbol else None
+        if bench is not None and not bench.close.empty:
+            closes[benchmark_symbol] = bench.close
+
+        # Align all series into one (bars x symbols) matrix
+        aligned = pd.concat(closes, axis=1).ffill().dropna()
+        if aligned.empty:
+            return None, "No overlapping data for this period", 404
+        matrix = aligned.to_numpy(dtype=np.float64)
+        columns = list(aligned.columns)
+
+        start, end = matrix[0], matrix[-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            performance = np.where(start != 0, (matrix / start - 1) * 100, 0.0)
+            change = end - start
+            change_percent = np.where(start != 0, change / start * 100, 0.0)
+        if points:
+            rows = downsample_indices(matrix, points)
+            matrix, performance, aligned = matrix[rows], performance[rows], aligned.iloc[rows]
+        performance = np.round(performance, 2)
+        prices = np.round(matrix, 2)
+
+        if period == '1d' or period == '5d':
+            dates = aligned.index.strftime('%m-%d %H:%M').tolist()
+        else:
+            dates = aligned.index.strftime('%Y-%m-%d').tolist()
+
+        series = {}
+        for i, symbol in enumerate(columns):
+            if symbol == benchmark_symbol and symbol not in symbols:
+                continue
+            series[symbol] = {
+                'prices': prices[:, i].tolist(),
+                'performance': performance[:, i].tolist(),
+                'price_change': round(float(change[i]), 2),
+                'price_change_percent': round(float(change_percent[i]), 2),
+                'end_price': round(float(end[i]), 2)
+            }
+
+        data = {
+            'dates': dates,
+            'symbols': [symbol for symbol in symbols if symbol in series],
+            'series': series,
+            'missing': missing
+        }
+        if benchmark_symbol in columns:
+            data['benchmark'] = {
+                'symbol': benchmark_symbol,
+                'name': bench.name,
+                'performance': performance[:, columns.index(benchmark_symbol)].tolist()
+            }
+
+        return (data, None, 200)
+
+    except Exception as e:
+        logger.exception("Error in get_multi_comparison_for_period for %s (%s)", symbols, period)
         return None, str(e), 500
 
 def get_interval_for_period(period):
@@ -148,40 +304,95 @@ def get_interval_for_period(period):
 
 # Endpoint: Dashboard
 @app.route('/api/dashboard/<symbol>', methods=['GET'])
-@cache.memoize(timeout=300) # Cache for 5 minutes
 def api_dashboard(symbol):
+    if not symbol:
+        return jsonify({'error': 'No symbol provided'}), 400
     try:
-        if not symbol:
-            return jsonify({'error': 'No symbol provided'}), 400
-        
-        stock = yf.Ticker(symbol)
-        stock_info = stock.info
-
-        dashboard_data = {key: stock_info.get(key) for key in [
-            'longName', 'sector', 'industry', 'website', 'marketCap',
-            'trailingPE', 'trailingEps', 'dividendYield', 'targetMeanPrice',
-            'averageAnalystRating', 'regularMarketPrice', 'regularMarketOpen',
-            'regularMarketDayHigh', 'regularMarketDayLow', 'regularMarketPreviousClose',
-            'fiftyTwoWeekHigh', 'fiftyTwoWeekLow', 'longBusinessSummary'
-        ]}
-
-        # Add custom-calculated fields
-        dashboard_data['forecast_price'] = get_price_forecast(symbol)
-        dashboard_data['marketCap'] = humanize.intword(dashboard_data.get('marketCap', 0))
-
-        q_income_stmt = stock.quarterly_income_stmt
-        if not q_income_stmt.empty:
-            q_income_stmt.columns = q_income_stmt.columns.strftime('%Y-%m-%d')
-            dashboard_data['income_grid_items'] = create_income_grid_data(q_income_stmt)
-        else:
-            dashboard_data['income_grid_items'] = []
-
+        dashboard_data = get_dashboard_data(symbol.upper())
     except Exception as e:
-        print(f"Error fetching dashboard data for {symbol}: {str(e)}")
+        logger.warning("Error fetching dashboard data for %s: %s", symbol, e)
         return jsonify({'error': str(e)}), 500
     
     return jsonify(dashboard_data)
 
+DASHBOARD_INFO_KEYS = [
+    'longName', 'sector', 'industry', 'website', 'marketCap',
+    'trailingPE', 'trailingEps', 'dividendYield', 'targetMeanPrice',
+    'averageAnalystRating', 'regularMarketPrice', 'regularMarketOpen',
+    'regularMarketDayHigh', 'regularMarketDayLow', 'regularMarketPreviousClose',
+    'fiftyTwoWeekHigh', 'fiftyTwoWeekLow', 'longBusinessSummary'
+]
+
+def fetch_dashboard_info(symbol):
+    stock_info = scheduler.call('info', lambda: yf.Ticker(symbol).info)
+    return {key: stock_info.get(key) for key in DASHBOARD_INFO_KEYS}
+
+# Helper: Fundamentals
+
+@swr_cache.cached('fundamentals')
+def get_fundamentals(symbol):
+    """Formatted statement history and income grid from the fundamentals store"""
+    return fundamentals.summarize(symbol, fundamentals_store.statement(symbol))
+
+def fetch_income_grid(symbol):
+    return get_fundamentals(symbol)['income_grid_items']
+
+# Endpoint: Fundamentals
+@app.route('/api/fundamentals/<symbol>', methods=['GET'])
+def api_fundamentals(symbol):
+    try:
+        quarters = int(request.args.get('quarters', fundamentals.DEFAULT_QUARTERS))
+    except ValueError:
+        return jsonify({'error': 'quarters must be an integer'}), 400
+    if not 1 <= quarters <= fundamentals.MAX_QUARTERS:
+        return jsonify({'error': f'quarters must be between 1 and {fundamentals.MAX_QUARTERS}'}), 400
+    try:
+        summary = get_fundamentals(symbol.upper())
+    except Exception as e:
+        logger.warning("Error fetching fundamentals for %s: %s", symbol, e)
+        return jsonify({'error': str(e)}), 500
+    return jsonify(fundamentals.history(summary, quarters))
+
+@swr_cache.cached('dashboard')
+def get_dashboard_data(symbol):
+    """Assemble the dashboard from its independent parts fetched concurrently.
+
+    A part that fails or misses DASHBOARD_PART_TIMEOUT is left empty and
+    reported in section_status instead of failing the whole dashboard.
+    """
+    futures = {
+        'info': upstream.submit(dashboard_executor, fetch_dashboard_info, symbol),
+        'forecast': upstream.submit(dashboard_executor, get_price_forecast, symbol),
+        'income': upstream.submit(dashboard_executor, fetch_income_grid, symbol),
+    }
+    deadline = time.monotonic() + DASHBOARD_PART_TIMEOUT
+    results = {}
+    section_status = {}
+    for section, future in futures.items():
+        try:
+            results[section] = future.result(timeout=max(0, deadline - time.monotonic()))
+            section_status[section] = 'ok'
+        except FuturesTimeoutError:
+            logger.warning("Dashboard section %s timed out for %s", section, symbol)
+            section_status[section] = 'timeout'
+        except Exception as e:
+            logger.warning("Dashboard section %s failed for %s: %s", section, symbol, e)
+            section_status[section] = 'error'
+
+    if all(status != 'ok' for status in section_status.values()):
+        raise RuntimeError(f"Could not load any dashboard data for {symbol}")
+
+    dashboard_data = results.get('info') or {key: None for key in DASHBOARD_INFO_KEYS}
+
+    # Add custom-calculated fields
+    dashboard_data['forecast_price'] = results.get('forecast')
+    market_cap = dashboard_data.get('marketCap')
+    dashboard_data['marketCap'] = humanize.intword(market_cap) if market_cap else None
+    dashboard_data['income_grid_items'] = results.get('income', [])
+    dashboard_data['section_status'] = section_status
+
+    return dashboard_data
+
 @app.route('/testbackend', methods=['GET'])
 def test_backend():
     return jsonify({'message': 'Test backend is working!'})
@@ -0,0 +1,93 @@
+import logging
+import threading
+import time
+
+from bar_store import bar_store
+from upstream import BACKGROUND, set_priority
+
+logger = logging.getLogger(__name__)
+
+# Benchmarks a comparison can be made against, with display names
+BENCHMARKS = {
+    '^GSPC': 'S&P 500',
+    '^IXIC': 'NASDAQ Composite',
+    '^DJI': 'Dow Jones',
+}
+
+BENCHMARK_ALIASES = {
+    'SP500': '^GSPC',
+    'GSPC': '^GSPC',
+    'NASDAQ': '^IXIC',
+    'IXIC': '^IXIC',
+    'DOW': '^DJI',
+    'DJI': '^DJI',
+}
+
+
+def resolve_benchmark(name):
+    """Map a benchmark= parameter to a known index symbol, or None"""
+    if not name:
+        return '^GSPC'
+    symbol = name.upper()
+    symbol = BENCHMARK_ALIASES.get(symbol, symbol)
+    return symbol if symbol in BENCHMARKS else None
+
+
+class BenchmarkSeries:
+    """Close prices and percent change since the first bar for one benchmark"""
+    def __init__(self, symbol, close):
+        self.symbol = symbol
+        self.name = BENCHMARKS[symbol]
+        self.close = close
+        self.performance = (close / close.iloc[0] - 1) * 100 if not close.empty else close
+
+
+class BenchmarkCache:
+    """Benchmark series shared by every comparison for a (period, interval).
+
+    Entries are reloaded once they are older than refresh_interval; a
+    background thread started with start() keeps the ones in use warm so
+    requests rarely pay for the reload themselves.
+    """
+
+    def __init__(self, refresh_interval=300):
+        self.refresh_interval = refresh_interval
+        self._entries = {}  # (symbol, period, interval) -> (BenchmarkSeries, loaded_at)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _load(self, key):
+        symbol, period, interval = key
+        hist = bar_store.history(symbol, period=period, interval=interval)
+        series = BenchmarkSeries(symbol, hist['Close'].dropna())
+        with self._lock:
+            self._entries[key] = (series, time.monotonic())
+        return series
+
+    def get(self, symbol, period, interval):
+        key = (symbol, period, interval)
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[1] < self.refresh_interval:
+            return entry[0]
+        return self._load(key)
+
+    def refresh_all(self):
+        for key in list(self._entries):
+            try:
+                self._load(key)
+            except Exception as e:
+                logger.warning("Error refreshing benchmark %s: %s", key, e)
+
+    def start(self):
+        """Start the background refresh loop once per process"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='benchmark-refresh', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        set_priority(BACKGROUND)
+        while True:
+            time.sleep(self.refresh_interval * 0.8)
+            self.refresh_all()
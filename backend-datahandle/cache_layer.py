@@ -0,0 +1,339 @@
+"""Shared cache backends and stale-while-revalidate caching for the data service.
+
+SQLiteCache is a Flask-Caching backend stored in one SQLite file, so every
+worker process on a host shares the same entries. Point CACHE_TYPE at
+'cache_layer.SQLiteCache' to use it, or at 'RedisCache' (with
+CACHE_REDIS_URL) to share across hosts.
+
+SWRCache layers key families with their own fresh/stale lifetimes on top of
+whichever backend is configured: an entry past its fresh lifetime is still
+served while one background refresh recomputes it.
+"""
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from flask_caching import Cache
+from flask_caching.backends.base import BaseCache
+
+from upstream import BACKGROUND, priority
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCache(BaseCache):
+    """Size-bounded cache in a SQLite database shared between processes"""
+
+    def __init__(self, path, default_timeout=300, threshold=5000):
+        super().__init__(default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self._local = threading.local()
+        self._sets = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL, stored_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_cache_expires ON cache (expires)')
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        path = config.get('CACHE_SQLITE_PATH') or os.path.join(config.get('CACHE_DIR') or '/tmp', 'datahandle-cache.db')
+        kwargs.update(threshold=config['CACHE_THRESHOLD'])
+        return cls(path, *args, **kwargs)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _expiry(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else float('inf')
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except Exception:
+            return None
+
+    def set(self, key, value, timeout=None):
+        now = time.time()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires, stored_at) VALUES (?, ?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout), now)
+        )
+        self._sets += 1
+        if self._sets % 100 == 0:
+            self._prune()
+        return True
+
+    def add(self, key, value, timeout=None):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, now))
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires, stored_at) VALUES (?, ?, ?, ?)',
+                (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout), now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def delete(self, key):
+        cursor = self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def has(self, key):
+        row = self._connect().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache')
+        return True
+
+    def _prune(self):
+        """Drop expired rows, then the oldest rows beyond the size threshold.
+
+        Rows stored without a timeout (e.g. forecast models) are never
+        evicted for size and don't count towards the threshold.
+        """
+        conn = self._connect()
+        never = float('inf')
+        conn.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = conn.execute('SELECT COUNT(*) FROM cache WHERE expires < ?', (never,)).fetchone()[0]
+        if count > self.threshold:
+            conn.execute(
+                'DELETE FROM cache WHERE key IN '
+                '(SELECT key FROM cache WHERE expires < ? ORDER BY stored_at LIMIT ?)',
+                (never, count - self.threshold)
+            )
+
+
+def configure_cache(app):
+    """Create the shared cache for app from the environment.
+
+    The default SQLiteCache is shared by every worker process on one host;
+    set CACHE_TYPE=RedisCache and CACHE_REDIS_URL to share across hosts.
+    """
+    app.config['CACHE_TYPE'] = os.getenv('CACHE_TYPE', 'cache_layer.SQLiteCache')
+    app.config['CACHE_SQLITE_PATH'] = os.getenv('CACHE_SQLITE_PATH', '/tmp/marketracker-cache/datahandle.db')
+    app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL')
+    app.config['CACHE_THRESHOLD'] = int(os.getenv('CACHE_THRESHOLD', '5000'))
+    app.config['CACHE_DEFAULT_TIMEOUT'] = 300  # 5 minutes
+    return Cache(app)
+
+
+class CacheFamily:
+    """Lifetimes for one group of keys: served fresh for `fresh` seconds, then
+    served stale for up to `stale` more seconds while being refreshed.
+
+    Values that is_complete(value) rejects are only fresh for retry_after
+    seconds, so partial results are replaced soon without blocking anyone.
+    When given, expires(value) decides the fresh lifetime of each complete
+    value instead of `fresh` (e.g. until the next market open); `fresh` still
+    paces refresh-ahead.
+    """
+    def __init__(self, name, fresh, stale=0, refresh_ahead=False, is_complete=None, retry_after=30,
+                 expires=None):
+        self.name = name
+        self.fresh = fresh
+        self.stale = stale
+        self.refresh_ahead = refresh_ahead
+        self.is_complete = is_complete
+        self.retry_after = retry_after
+        self.expires = expires
+
+    def fresh_for(self, value):
+        if self.is_complete is not None and not self.is_complete(value):
+            return min(self.fresh, self.retry_after)
+        if self.expires is not None:
+            return self.expires(value)
+        return self.fresh
+
+
+class _Access:
+    """Decayed access frequency for one cached call"""
+    def __init__(self, family, func, args):
+        self.family = family
+        self.func = func
+        self.args = args
+        self.score = 0.0
+        self.last = 0.0
+
+    def hit(self, half_life, now):
+        self.score = self.score * 0.5 ** ((now - self.last) / half_life) + 1
+        self.last = now
+
+
+class SWRCache:
+    """Stale-while-revalidate wrapper around a Flask-Caching Cache.
+
+    For families with refresh_ahead set, start_refresh_ahead() runs a loop
+    that recomputes frequently requested entries shortly before they go
+    stale, so popular keys are normally refreshed before anyone sees them
+    expire.
+    """
+
+    def __init__(self, cache, families, workers=4, max_tracked=1000):
+        self.cache = cache
+        self.families = {family.name: family for family in families}
+        self.max_tracked = max_tracked
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-refresh')
+        self._refreshing = set()
+        self._access = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.hits = 0
+        self.stale = 0
+        self.misses = 0
+
+    def _key(self, family, args):
+        return f"swr:{family}:" + ':'.join(str(arg) for arg in args)
+
+    def _store(self, family, key, value):
+        fresh = family.fresh_for(value)
+        self.cache.set(key, (value, time.time() + fresh), timeout=fresh + family.stale)
+
+    def refresh(self, family_name, func, *args):
+        """Recompute an entry now and store it"""
+        family = self.families[family_name]
+        value = func(*args)
+        if value is not None:
+            self._store(family, self._key(family_name, args), value)
+        return value
+
+    def _refresh_in_background(self, family_name, func, args):
+        key = self._key(family_name, args)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        # Only one process refreshes a key at a time
+        if not self.cache.add(f"{key}:refreshing", 1, timeout=60):
+            with self._lock:
+                self._refreshing.discard(key)
+            return
+
+        def run():
+            try:
+                with priority(BACKGROUND):
+                    self.refresh(family_name, func, *args)
+            except Exception as e:
+                logger.warning("Error refreshing cache entry %s: %s", key, e)
+            finally:
+                self.cache.delete(f"{key}:refreshing")
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(run)
+
+    def get(self, family_name, func, *args):
+        """Return the cached value for func(*args), serving stale entries
+        while a background refresh runs"""
+        key = self._key(family_name, args)
+        self._record_access(key, family_name, func, args)
+        entry = self.cache.get(key)
+        if entry is not None:
+            value, fresh_until = entry
+            if time.time() >= fresh_until:
+                self._count('stale')
+                self._refresh_in_background(family_name, func, args)
+            else:
+                self._count('hits')
+            return value
+        self._count('misses')
+        return self.refresh(family_name, func, *args)
+
+    def _count(self, result):
+        with self._lock:
+            setattr(self, result, getattr(self, result) + 1)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'stale': self.stale, 'misses': self.misses,
+                    'tracked': len(self._access)}
+
+    def _record_access(self, key, family_name, func, args):
+        family = self.families[family_name]
+        if not family.refresh_ahead:
+            return
+        now = time.time()
+        with self._lock:
+            access = self._access.get(key)
+            if access is None:
+                if len(self._access) >= self.max_tracked:
+                    coldest = min(self._access, key=lambda k: self._access[k].score)
+                    del self._access[coldest]
+                access = self._access[key] = _Access(family_name, func, args)
+            access.hit(family.fresh, now)
+
+    def refresh_ahead(self, min_score=2.0, lead=0.2):
+        """Refresh popular entries within `lead` of their fresh lifetime from
+        going stale, and forget keys nobody has asked for in a while"""
+        now = time.time()
+        with self._lock:
+            tracked = list(self._access.items())
+        for key, access in tracked:
+            family = self.families[access.family]
+            if now - access.last > family.fresh + family.stale:
+                with self._lock:
+                    self._access.pop(key, None)
+                continue
+            score = access.score * 0.5 ** ((now - access.last) / family.fresh)
+            if score < min_score:
+                continue
+            entry = self.cache.get(key)
+            if entry is None or entry[1] - now < family.fresh * lead:
+                self._refresh_in_background(access.family, access.func, access.args)
+
+    def start_refresh_ahead(self, interval=30, min_score=2.0, lead=0.2):
+        """Start the refresh-ahead loop once per process"""
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            def run():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.refresh_ahead(min_score, lead)
+                    except Exception as e:
+                        logger.exception("Error in cache refresh-ahead")
+
+            self._thread = threading.Thread(target=run, name='cache-refresh-ahead', daemon=True)
+            self._thread.start()
+
+    def cached(self, family_name):
+        """Decorator form of get() for functions of hashable positional args"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                return self.get(family_name, func, *args)
+            wrapper.uncached = func
+            return wrapper
+        return decorator
@@ -0,0 +1,139 @@
+"""Compact encodings for chart responses.
+
+With format=compact a chart endpoint sends its time axis as integer
+seconds and its series as encoded arrays instead of date strings and float
+lists:
+
+    {"t0": 1700000000, "dt": [0, 86400, 86400, 259200], "tz": "America/New_York",
+     "prices": {"encoding": "delta", "scale": 100, "values": [15012, 3, -7, 12]}}
+
+Bar i is at t0 + dt[0] + ... + dt[i] epoch seconds (regular bar spacing
+makes the steps compress to almost nothing); tz is the exchange time zone
+for formatting labels. A "delta" series holds its first value times scale
+followed by the differences between consecutive scaled values, so a running
+sum divided by scale decodes it. A "float32" series holds base64 of
+little-endian float32s that the browser can read with new Float32Array().
+"""
+import base64
+
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+
+FORMATS = ('full', 'compact')
+ENCODINGS = ('delta', 'float32')
+MIN_POINTS = 10
+MAX_POINTS = 10000
+
+
+class PayloadError(ValueError):
+    """Raised for an unknown format, encoding, field or point budget in a chart request"""
+
+
+def parse_options(args, available, compact_default):
+    """Read format, encoding and fields from request args.
+
+    Returns (compact, encoding, fields). Without fields= every available
+    field is sent in full format and only compact_default in compact format.
+    """
+    fmt = args.get('format', 'full')
+    if fmt not in FORMATS:
+        raise PayloadError(f"Invalid format. Use one of: {', '.join(FORMATS)}")
+    encoding = args.get('encoding', 'delta')
+    if encoding not in ENCODINGS:
+        raise PayloadError(f"Invalid encoding. Use one of: {', '.join(ENCODINGS)}")
+
+    compact = fmt == 'compact'
+    raw = args.get('fields')
+    if raw is None:
+        fields = set(compact_default if compact else available)
+    else:
+        fields = {field.strip() for field in raw.split(',') if field.strip()}
+        unknown = fields - set(available)
+        if unknown:
+            raise PayloadError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return compact, encoding, fields
+
+
+def epoch_seconds(index):
+    """Epoch seconds for a DatetimeIndex; naive indexes are taken as UTC"""
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    return index.tz_convert('UTC').as_unit('s').asi8.astype(np.int64)
+
+
+def encode_times(index):
+    ts = epoch_seconds(index)
+    t0 = int(ts[0]) if len(ts) else 0
+    return {
+        't0': t0,
+        'dt': np.diff(ts, prepend=t0).tolist(),
+        'tz': str(index.tz) if index.tz is not None else 'UTC'
+    }
+
+
+def encode_series(values, encoding='delta', decimals=2):
+    """Encode a 1-D array of finite floats"""
+    values = np.asarray(values, dtype=np.float64)
+    if encoding == 'float32':
+        data = values.astype('<f4').tobytes()
+        return {'encoding': 'float32', 'data': base64.b64encode(data).decode('ascii')}
+
+    scale = 10 ** decimals
+    scaled = np.rint(values * scale).astype(np.int64)
+    deltas = np.diff(scaled, prepend=0)
+    return {'encoding': 'delta', 'scale': scale, 'values': deltas.tolist()}
+
+
+def parse_points(args):
+    """Read the points= budget from request args; None means every bar"""
+    raw = args.get('points')
+    if raw is None:
+        return None
+    try:
+        points = int(raw)
+    except ValueError:
+        raise PayloadError('points must be an integer')
+    if not MIN_POINTS <= points <= MAX_POINTS:
+        raise PayloadError(f'points must be between {MIN_POINTS} and {MAX_POINTS}')
+    return points
+
+
+def downsample_indices(values, points):
+    """Row indices that reduce values to at most points rows while keeping
+    its shape.
+
+    values is one series or an aligned (rows x series) matrix. The first and
+    last rows are always kept; the rows in between are split into equal
+    buckets and each bucket contributes the rows holding every series'
+    minimum and maximum, so peaks and troughs of all series survive and the
+    series stay aligned. NaNs are never chosen as extremes. When points is
+    too small to hold a minimum and maximum per series, evenly spaced rows
+    are kept instead.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    n, width = values.shape
+    if n <= points:
+        return np.arange(n)
+
+    buckets = (points - 2) // (2 * width)
+    if buckets < 1:
+        return np.unique(np.linspace(0, n - 1, points).round().astype(np.int64))
+    interior = n - 2
+    bucket = (np.arange(interior) * buckets) // interior
+    starts = np.searchsorted(bucket, np.arange(buckets))
+    ends = np.append(starts[1:], interior)
+
+    keep = [np.array([0, n - 1])]
+    for column in values[1:-1].T:
+        # Sort by (bucket, value): each bucket's run starts at its minimum
+        # and ends at its maximum. NaNs sort last, so step back over them.
+        lows = np.where(np.isnan(column), np.inf, column)
+        highs = np.where(np.isnan(column), -np.inf, column)
+        by_low = np.lexsort((lows, bucket))
+        by_high = np.lexsort((highs, bucket))
+        keep.append(by_low[starts] + 1)
+        keep.append(by_high[ends - 1] + 1)
+    return np.unique(np.concatenate(keep))
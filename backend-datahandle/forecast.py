@@ -0,0 +1,309 @@
+"""Next-day close forecasts from persisted linear regression models.
+
+Each symbol's model is stored as the sufficient statistics of an ordinary
+least squares fit (X'X and X'y over the training window), the window's
+bounds and the latest prediction; the coefficients are not stored but
+re-solved from the statistics. Serving a forecast is one lookup plus a 6x6
+solve; when new daily bars arrive the statistics are updated by
+adding the new rows and subtracting the ones that slid out of the window, so
+no full refit runs in the request path.
+
+Models are kept in the shared cache backend by default (FORECAST_STORE=cache),
+so with CACHE_TYPE=RedisCache every serverless instance and the batch trainer
+see the same models and a cold start loses nothing. FORECAST_STORE=files
+keeps them under FORECAST_DIR instead, which is only shared if that directory
+is a mount every instance sees. A model that is lost anyway is refit from
+the stored bars on its next request.
+
+Batch training (uses the same CACHE_* / FORECAST_* settings as the service):
+    python forecast.py --symbols AAPL,MSFT
+    python forecast.py --csv ../backend/nasdaq_companies.csv
+    python forecast.py --all        # refresh every stored model
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import threading
+import time
+
+from flask import Flask
+
+from bar_store import bar_store
+from cache_layer import configure_cache
+from upstream import BACKGROUND, set_priority
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+FEATURES = ['Open', 'High', 'Low', 'Close', 'Volume']
+TRAIN_PERIOD = '2y'
+# Volume is scaled down so every feature has a similar magnitude
+FEATURE_SCALE = (1.0, 1.0, 1.0, 1.0, 1e-6)
+
+
+def _design(frame):
+    """Rows of [1, Open, High, Low, Close, Volume] for a bar frame"""
+    features = frame[FEATURES].to_numpy(dtype=np.float64) * FEATURE_SCALE
+    return np.hstack([np.ones((len(features), 1)), features])
+
+
+def _training_rows(frame):
+    """Design rows, next-day close targets and row timestamps"""
+    frame = frame.dropna(subset=FEATURES)
+    closes = frame['Close'].to_numpy(dtype=np.float64)
+    ts = frame.index.tz_convert('UTC').as_unit('s').asi8.astype(np.int64)
+    return _design(frame)[:-1], closes[1:], ts[:-1]
+
+
+def _solve(xtx, xty):
+    """Coefficients [intercept, *features] from the normal equations, centred
+    the same way sklearn's LinearRegression centres its inputs"""
+    n = xtx[0, 0]
+    sum_x = xtx[0, 1:]
+    sum_y = xty[0]
+    cxx = xtx[1:, 1:] - np.outer(sum_x, sum_x) / n
+    cxy = xty[1:] - sum_x * sum_y / n
+    beta = np.linalg.lstsq(cxx, cxy, rcond=None)[0]
+    intercept = (sum_y - sum_x @ beta) / n
+    return np.concatenate([[intercept], beta])
+
+
+class ForecastModel:
+    def __init__(self, xtx, xty, window_start, trained_through, anchor_close,
+                 forecast, updated_at):
+        self.xtx = xtx
+        self.xty = xty
+        self.window_start = int(window_start)
+        self.trained_through = int(trained_through)
+        self.anchor_close = float(anchor_close)
+        self.forecast = float(forecast)
+        self.updated_at = float(updated_at)
+
+
+class FileStorage:
+    """Model blobs as one .npz file per symbol under root"""
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"{symbol}.npz")
+
+    def get(self, symbol):
+        try:
+            with open(self._path(symbol), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, symbol, data):
+        path = self._path(symbol)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def symbols(self):
+        return sorted(name[:-4] for name in os.listdir(self.root) if name.endswith('.npz'))
+
+
+class CacheStorage:
+    """Model blobs in a Flask-Caching backend, stored without expiry"""
+
+    PREFIX = 'forecast:model:'
+    INDEX = 'forecast:symbols'
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def get(self, symbol):
+        return self.cache.get(self.PREFIX + symbol)
+
+    def set(self, symbol, data):
+        self.cache.set(self.PREFIX + symbol, data, timeout=0)
+        # The index only feeds --all; a symbol lost in a racing update is
+        # picked up again on its next save
+        symbols = self.cache.get(self.INDEX) or []
+        if symbol not in symbols:
+            self.cache.set(self.INDEX, sorted(set(symbols) | {symbol}), timeout=0)
+
+    def symbols(self):
+        return [symbol for symbol in self.cache.get(self.INDEX) or [] if self.get(symbol) is not None]
+
+
+def model_storage(cache):
+    """Storage selected by FORECAST_STORE: 'cache' (default) or 'files'"""
+    if os.getenv('FORECAST_STORE', 'cache') == 'files':
+        return FileStorage(os.getenv('FORECAST_DIR', '/tmp/marketracker-forecasts'))
+    return CacheStorage(cache)
+
+
+class ForecastStore:
+    """Persists one small .npz model per symbol in a FileStorage or CacheStorage"""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def load(self, symbol):
+        data = self.storage.get(symbol)
+        if data is None:
+            return None
+        try:
+            with np.load(io.BytesIO(data), allow_pickle=False) as data:
+                meta = data['meta']
+                return ForecastModel(data['xtx'], data['xty'], meta[0], meta[1],
+                                     data['values'][0], data['values'][1], data['values'][2])
+        except Exception as e:
+            logger.warning("Discarding unreadable forecast model for %s: %s", symbol, e)
+            return None
+
+    def save(self, symbol, model):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            xtx=model.xtx,
+            xty=model.xty,
+            meta=np.array([model.window_start, model.trained_through], dtype=np.int64),
+            values=np.array([model.anchor_close, model.forecast, model.updated_at])
+        )
+        self.storage.set(symbol, buffer.getvalue())
+
+    def symbols(self):
+        return self.storage.symbols()
+
+    @staticmethod
+    def _window(symbol):
+        return bar_store.history(symbol, period=TRAIN_PERIOD, interval='1d').dropna(subset=FEATURES)
+
+    @staticmethod
+    def _covers(model, window):
+        """True if model was trained on exactly window's training rows"""
+        _, _, window_ts = _training_rows(window)
+        return (len(window_ts) > 0 and model.trained_through == window_ts[-1]
+                and model.window_start == window_ts[0])
+
+    @staticmethod
+    def _fit(window, latest):
+        x, y, ts = _training_rows(window)
+        if len(y) < len(FEATURES) + 1:
+            return None
+        xtx = x.T @ x
+        xty = x.T @ y
+        return ForecastModel(xtx, xty, ts[0], ts[-1], window['Close'].iloc[-2],
+                             (_design(latest) @ _solve(xtx, xty))[0], time.time())
+
+    @staticmethod
+    def _update(model, window, latest, symbol):
+        """Slide an existing model's window forward, or None if it can't be"""
+        stored = bar_store.stored(symbol, '1d').dropna(subset=FEATURES)
+        x, y, ts = _training_rows(stored)
+        anchor = np.searchsorted(ts, model.trained_through)
+        if anchor >= len(ts) or ts[anchor] != model.trained_through:
+            return None
+        # Past prices changed (split or dividend adjustment): stats are stale
+        if not np.isclose(stored['Close'].iloc[anchor], model.anchor_close, rtol=1e-6):
+            return None
+
+        _, _, window_ts = _training_rows(window)
+        if not len(window_ts) or model.window_start > window_ts[0]:
+            return None
+        added = (ts > model.trained_through) & (ts <= window_ts[-1])
+        removed = (ts >= model.window_start) & (ts < window_ts[0])
+        if removed.any() and ts[removed][0] != model.window_start:
+            return None
+
+        xtx = model.xtx + x[added].T @ x[added] - x[removed].T @ x[removed]
+        xty = model.xty + x[added].T @ y[added] - x[removed].T @ y[removed]
+        return ForecastModel(xtx, xty, window_ts[0], window_ts[-1], window['Close'].iloc[-2],
+                             (_design(latest) @ _solve(xtx, xty))[0], time.time())
+
+    def train(self, symbol):
+        """Bring symbol's model up to date with the latest bars and persist it"""
+        symbol = symbol.upper()
+        with self._symbol_lock(symbol):
+            window = self._window(symbol)
+            if len(window) < 2:
+                return None
+            latest = window.iloc[-1:]
+            model = self.load(symbol)
+            updated = None
+            if model is not None:
+                if self._covers(model, window):
+                    model.forecast = (_design(latest) @ _solve(model.xtx, model.xty))[0]
+                    model.updated_at = time.time()
+                    updated = model
+                else:
+                    updated = self._update(model, window, latest, symbol)
+            if updated is None:
+                updated = self._fit(window, latest)
+            if updated is None:
+                return None
+            self.save(symbol, updated)
+            return updated
+
+    def forecast(self, symbol):
+        """Next-day forecast from the latest bars. The bar store decides when
+        bars are refetched, so a forecast follows each new bar; the stored
+        model is only rewritten when the training window has moved."""
+        symbol = symbol.upper()
+        model = self.load(symbol)
+        if model is not None:
+            window = self._window(symbol)
+            if len(window) >= 2 and self._covers(model, window):
+                return float((_design(window.iloc[-1:]) @ _solve(model.xtx, model.xty))[0])
+        model = self.train(symbol)
+        return model.forecast if model is not None else None
+
+
+def _csv_symbols(path):
+    with open(path, newline='', encoding='utf-8') as csvfile:
+        return [row['Symbol'] for row in csv.DictReader(csvfile) if row.get('Symbol')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Train and persist forecast models')
+    parser.add_argument('--symbols', help='Comma-separated symbols to train')
+    parser.add_argument('--csv', help='Company CSV with a Symbol column')
+    parser.add_argument('--all', action='store_true', help='Retrain every stored model')
+    args = parser.parse_args()
+
+    # Same model storage the service uses
+    forecast_store = ForecastStore(model_storage(configure_cache(Flask(__name__))))
+
+    symbols = []
+    if args.symbols:
+        symbols += [s.strip().upper() for s in args.symbols.split(',') if s.strip()]
+    if args.csv:
+        symbols += _csv_symbols(args.csv)
+    if args.all:
+        symbols += forecast_store.symbols()
+    symbols = list(dict.fromkeys(symbols))
+
+    set_priority(BACKGROUND)
+    trained = failed = 0
+    started = time.monotonic()
+    for symbol in symbols:
+        try:
+            if forecast_store.train(symbol) is not None:
+                trained += 1
+            else:
+                failed += 1
+        except Exception as e:
+            logger.warning("Error training forecast for %s: %s", symbol, e)
+            failed += 1
+    print(f"Trained {trained} models ({failed} failed) in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+"""Quarterly income statements, stored per symbol and formatted in bulk.
+
+Each symbol's statement history is kept as one .npz file: the line item
+labels, the quarter end dates (newest first) and a (line items x quarters)
+value matrix. A statement is downloaded again only once a new quarter may
+have been reported (see market_hours.fundamentals_ttl); new columns are
+merged into the stored ones, so history grows past the few quarters yfinance
+returns at a time and restated quarters replace the stored values.
+
+Line items are classified through a label map that is filled once per
+distinct label, and values are formatted as whole arrays.
+"""
+import logging
+import os
+import threading
+import time
+from functools import lru_cache
+
+import market_hours
+from lazy import lazy_import
+from upstream import scheduler, yf
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+MAX_QUARTERS = 40
+DEFAULT_QUARTERS = 8
+
+POSITIVE_ITEMS = ('Total Revenue', 'Gross Profit', 'Operating Income', 'Net Income',
+                  'Interest Income', 'Other Income Expense', 'Pretax Income')
+NEGATIVE_ITEMS = ('Total Expenses', 'Operating Expense', 'Cost Of Revenue',
+                  'Interest Expense', 'Tax Provision', 'Research And Development',
+                  'Selling General And Administration')
+
+# Magnitude thresholds for formatting, largest first
+UNITS = ((1e9, 'B'), (1e6, 'M'), (1e3, 'K'))
+
+
+@lru_cache(maxsize=4096)
+def classify(label):
+    """css class for a line item: positive, negative or empty. A label is
+    matched by substring, so e.g. 'Net Income Common Stockholders' is positive"""
+    lowered = label.lower()
+    if any(item.lower() in lowered for item in POSITIVE_ITEMS):
+        return 'positive'
+    if any(item.lower() in lowered for item in NEGATIVE_ITEMS):
+        return 'negative'
+    return ''
+
+
+@lru_cache(maxsize=4096)
+def display_label(label):
+    return label.replace('_', ' ').title()
+
+
+def format_money(values):
+    """Format an array of amounts as $1.23B / $4.56M / $7.89K / $0.12"""
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    conditions = [magnitude >= limit for limit, _ in UNITS]
+    divisor = np.select(conditions, [limit for limit, _ in UNITS], 1.0)
+    suffix = np.select(conditions, [unit for _, unit in UNITS], '')
+    return np.char.add(np.char.add('$', np.char.mod('%.2f', values / divisor)), suffix)
+
+
+class Statement:
+    """Stored quarterly values for one symbol"""
+    def __init__(self, labels, periods, values, checked_at, expires_at):
+        self.labels = labels      # str array, one per line item
+        self.periods = periods    # datetime64[D] array, newest first
+        self.values = values      # float64 (labels x periods), NaN where missing
+        self.checked_at = checked_at
+        self.expires_at = expires_at
+
+    @property
+    def latest_period(self):
+        return self.periods[0].astype(object) if len(self.periods) else None
+
+
+class FundamentalsStore:
+    """Persists one .npz income statement history per symbol under root"""
+
+    def __init__(self, root, max_quarters=MAX_QUARTERS):
+        self.root = root
+        self.max_quarters = max_quarters
+        self._locks = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"{symbol}.npz")
+
+    def _symbol_lock(self, symbol):
+        with self._lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def load(self, symbol):
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return Statement(data['labels'], data['periods'], data['values'],
+                                 float(data['times'][0]), float(data['times'][1]))
+        except Exception as e:
+            logger.warning("Discarding unreadable statement file %s: %s", path, e)
+            return None
+
+    def save(self, symbol, statement):
+        path = self._path(symbol)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                labels=statement.labels,
+                periods=statement.periods,
+                values=statement.values,
+                times=np.array([statement.checked_at, statement.expires_at])
+            )
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _frame(statement):
+        return pd.DataFrame(statement.values, index=pd.Index(statement.labels),
+                            columns=pd.DatetimeIndex(statement.periods))
+
+    def _merge(self, stored, fetched):
+        """Combine a downloaded statement with the stored history; fetched
+        values win where both have a quarter"""
+        fetched = fetched.apply(pd.to_numeric, errors='coerce')
+        fetched.columns = pd.DatetimeIndex(fetched.columns).tz_localize(None).normalize()
+        fetched.index = fetched.index.astype(str)
+        if stored is not None and len(stored.periods):
+            old = self._frame(stored)
+            labels = fetched.index.append(old.index.difference(fetched.index, sort=False))
+            fetched = fetched.combine_first(old).reindex(labels)
+        fetched = fetched.loc[:, ~fetched.columns.duplicated()]
+        fetched = fetched[fetched.columns.sort_values(ascending=False)[:self.max_quarters]]
+        return (fetched.index.to_numpy(dtype=str),
+                fetched.columns.to_numpy(dtype='datetime64[D]'),
+                fetched.to_numpy(dtype=np.float64, na_value=np.nan))
+
+    def _fetch(self, symbol, stored):
+        fetched = scheduler.call('quarterly_income_stmt', lambda: yf.Ticker(symbol).quarterly_income_stmt)
+        now = time.time()
+        if fetched is None or fetched.empty:
+            if stored is None:
+                stored = Statement(np.array([], dtype=str), np.array([], dtype='datetime64[D]'),
+                                   np.empty((0, 0)), now, now)
+        else:
+            stored = Statement(*self._merge(stored, fetched), now, now)
+        stored.checked_at = now
+        stored.expires_at = now + market_hours.fundamentals_ttl(stored.latest_period)
+        return stored
+
+    def statement(self, symbol):
+        """Return symbol's statement history, downloading only when a new
+        quarter may have been reported since it was last checked"""
+        symbol = symbol.upper()
+        with self._symbol_lock(symbol):
+            stored = self.load(symbol)
+            if stored is not None and time.time() < stored.expires_at:
+                return stored
+            try:
+                updated = self._fetch(symbol, stored)
+            except Exception as e:
+                if stored is None:
+                    raise
+                logger.warning("Serving stored statement for %s after refresh error: %s", symbol, e)
+                return stored
+            self.save(symbol, updated)
+            return updated
+
+    def symbols(self):
+        return sorted(name[:-4] for name in os.listdir(self.root) if name.endswith('.npz'))
+
+
+def income_grid(statement):
+    """Latest quarter's non-zero line items in the dashboard's grid format"""
+    if not len(statement.periods):
+        return []
+    latest = statement.values[:, 0]
+    keep = ~np.isnan(latest) & (latest != 0)
+    labels = statement.labels[keep]
+    raw = latest[keep]
+    return [
+        {'label': display_label(label), 'value': value, 'css_class': classify(label), 'raw_value': amount}
+        for label, value, amount in zip(labels.tolist(), format_money(raw).tolist(), raw.tolist())
+    ]
+
+
+def summarize(symbol, statement):
+    """Everything the dashboard and /api/fundamentals serve for a symbol,
+    computed once per stored statement"""
+    values = statement.values
+    formatted = np.where(np.isnan(values), None, format_money(values)) if values.size else values
+    raw = np.where(np.isnan(values), None, values) if values.size else values
+    return {
+        'symbol': symbol,
+        'period': str(statement.periods[0]) if len(statement.periods) else None,
+        'expires_at': statement.expires_at,
+        'quarters': statement.periods.astype(str).tolist(),
+        'items': [
+            {'label': display_label(label), 'css_class': classify(label),
+             'values': raw_row, 'formatted': formatted_row}
+            for label, raw_row, formatted_row in zip(statement.labels.tolist(), raw.tolist(), formatted.tolist())
+        ],
+        'income_grid_items': income_grid(statement),
+    }
+
+
+def history(summary, quarters=DEFAULT_QUARTERS):
+    """The newest `quarters` quarters of a summary, without the grid"""
+    return {
+        'symbol': summary['symbol'],
+        'quarters': summary['quarters'][:quarters],
+        'items': [
+            {**item, 'values': item['values'][:quarters], 'formatted': item['formatted'][:quarters]}
+            for item in summary['items']
+        ],
+    }
+
+
+fundamentals_store = FundamentalsStore(os.getenv('FUNDAMENTALS_DIR', '/tmp/marketracker-fundamentals'))
@@ -0,0 +1,213 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Response, g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        names = self.labels + ('le',)
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(names, key + (_format_value(bound),))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(names, key + ("+Inf",))} {state[-1]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {state[-1]}')
+        return lines
+
+
+class Collected:
+    """Metric whose samples are read from a callback at scrape time, for
+    components that already keep their own counters"""
+
+    def __init__(self, name, help, kind, labels, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self.collect()):
+            lines.append(f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}')
+        return lines
+
+
+class Registry:
+    """In-process metrics rendered in the Prometheus text format.
+
+    Values are per process: with several workers each one reports its own
+    series and Prometheus sums them by instance.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collect(self, name, help, kind, labels, collect):
+        """Register collect() -> [(label values, value), ...] as a gauge or counter"""
+        return self._add(Collected(name, help, kind, labels, collect))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+request_latency = registry.histogram(
+    'http_request_duration_seconds', 'Time spent handling a request',
+    labels=('method', 'endpoint', 'status'))
+
+upstream_latency = registry.histogram(
+    'yfinance_request_duration_seconds', 'Time spent in yfinance calls',
+    labels=('method',))
+
+upstream_calls = registry.counter(
+    'yfinance_requests_total', 'yfinance calls by method and outcome',
+    labels=('method', 'outcome'))
+
+
+@contextmanager
+def yfinance_call(method):
+    """Time and count one upstream yfinance call, e.g. method='history'"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        upstream_latency.observe(time.perf_counter() - started, method=method)
+        upstream_calls.inc(method=method, outcome=outcome)
+
+
+_caches = {}
+_CACHE_RESULTS = {'hits': 'hit', 'misses': 'miss', 'coalesced': 'coalesced',
+                  'stale': 'stale', 'revalidated': 'revalidated'}
+
+
+def register_cache(name, stats):
+    """Expose a cache's lookup counters; stats() returns a dict with any of
+    hits, misses, coalesced, stale and revalidated"""
+    _caches[name] = stats
+
+
+def _collect_caches():
+    samples = []
+    for name, stats in list(_caches.items()):
+        counts = stats()
+        samples.extend(((name, result), counts[key])
+                       for key, result in _CACHE_RESULTS.items() if key in counts)
+    return samples
+
+
+registry.collect('cache_lookups_total', 'Cache lookups by cache and result',
+                 'counter', ('cache', 'result'), _collect_caches)
+
+
+def endpoint_label():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+def install(app, path='/metrics'):
+    """Time every request by route and serve the registry at path"""
+
+    @app.before_request
+    def start_timer():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            request_latency.observe(time.perf_counter() - started, method=request.method,
+                                    endpoint=endpoint_label(), status=str(response.status_code))
+        return response
+
+    @app.route(path, methods=['GET'])
+    def metrics():
+        return Response(registry.render(), content_type=CONTENT_TYPE)
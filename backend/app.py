@@ -1,19 +1,71 @@
-from flask import Flask, request, jsonify, g
+from flask import Flask, request, jsonify, g, Response
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-import yfinance as yf
-from datetime import datetime, timedelta, timezone
-import bcrypt
-from database import db
-from models import User, Portfolio, Transaction, Company
-from sqlalchemy import or_, case
+from datetime import timedelta
+from database import db, install_query_metrics
+from models import STARTING_BALANCE, User, Portfolio, Company
+from quote_cache import QuoteCache
+from identity import UserNotFound, resolve_current_user
+from password_hashing import PasswordHasher, HasherBusy
+from search_index import SearchEngine
+from bar_store import bar_store, period_days
+import market_hours
+from chart_payload import (
+    parse_options, parse_points, downsample_indices, encode_series, encode_times
+)
+from gateway import GatewayClient, CircuitOpenError
+from quote_stream import QuoteHub, HubFull
+from trade_engine import TradeError, parse_order, apply_order, current_balance
+from snapshots import HISTORY_PERIODS, take_snapshots, snapshot_history
+from transaction_history import (
+    DEFAULT_PAGE_SIZE, HistoryQueryError, filtered_query, transaction_page, symbol_aggregates
+)
+from sqlalchemy import text
+import metrics
+import compression
+from metrics import register_cache
+import hashlib
+import logging
 import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
 from dotenv import load_dotenv
-import requests
 load_dotenv()
 
+# yfinance (and pandas under it) loads on first use to keep cold starts fast;
+# every call to it is rate limited and prioritised by the upstream scheduler
+import upstream
+from upstream import INTERACTIVE, BACKGROUND, scheduler, yf
+
+# LOG_LEVEL=DEBUG for verbose output; WARNING keeps production logs quiet
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 
+# Request latency, SQL statements per request, upstream and cache counters at /metrics
+metrics.install(app)
+install_query_metrics(app)
+
+# ETags, 304s and gzip/brotli for JSON responses
+compression.install(app)
+
+# Requests whose upstream calls go ahead of chart, search and background work
+INTERACTIVE_ENDPOINTS = {'trade', 'trade_batch', 'get_portfolio'}
+
+@app.before_request
+def set_upstream_priority():
+    if request.endpoint in INTERACTIVE_ENDPOINTS:
+        g.upstream_priority = upstream.set_priority(INTERACTIVE)
+
+@app.teardown_request
+def reset_upstream_priority(error=None):
+    token = g.pop('upstream_priority', None)
+    if token is not None:
+        upstream.reset_priority(token)
+
 # Define allowed origins
 origins = [
     "http://localhost:3000",
@@ -38,18 +90,18 @@ CORS(app, resources={
 })
 
 # Configuration
-print("Starting application configuration...")
+logger.debug("Starting application configuration...")
 database_url = os.getenv('POSTGRES_URL')
-print(f"POSTGRES_URL: {'set' if database_url else 'not set'}")
+logger.debug("POSTGRES_URL: %s", 'set' if database_url else 'not set')
 
 if not database_url:
     # Fallback to DATABASE_URI if POSTGRES_URL is not set
     database_url = os.getenv('DATABASE_URI')
-    print(f"DATABASE_URI: {'set' if database_url else 'not set'}")
+    logger.debug("DATABASE_URI: %s", 'set' if database_url else 'not set')
     if not database_url:
         raise RuntimeError('No database connection string found. Set either POSTGRES_URL or DATABASE_URI environment variable')
 
-print(f"Database URL (masked): {database_url[:15]}...{database_url[-15:]}")
+logger.debug("Database URL (masked): %s...%s", database_url[:15], database_url[-15:])
 
 # Update database URL format
 if database_url.startswith('postgres://'):
@@ -79,27 +131,39 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
 
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
-print(f"JWT_SECRET_KEY: {'set' if app.config['JWT_SECRET_KEY'] else 'not set'}")
+logger.debug("JWT_SECRET_KEY: %s", 'set' if app.config['JWT_SECRET_KEY'] else 'not set')
 
 if not app.config['JWT_SECRET_KEY']:
     raise RuntimeError('JWT_SECRET_KEY environment variable is not set')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=30)
 
-print("Initializing database...")
+logger.debug("Initializing database...")
 # Initialize extensions
 db.init_app(app)
 jwt = JWTManager(app)
 
-# Create database tables within the application context.
-# This is the recommended way to ensure tables are created correctly
-# without causing startup issues.
-with app.app_context():
+def create_schema():
+    """Create missing tables, and indexes that create_all skips on existing tables"""
     db.create_all()
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema (run on deploy, not per cold start)"""
+    create_schema()
+    print("Database schema is up to date")
+
+# Local development can still create the schema on startup
+if os.getenv('AUTO_CREATE_TABLES') == '1':
+    with app.app_context():
+        create_schema()
 
 # Add JWT error handlers
 @jwt.invalid_token_loader
 def invalid_token_callback(error):
-    print(f"Invalid token error: {error}")
+    logger.info("Invalid token error: %s", error)
     return jsonify({
         'error': 'Invalid token',
         'message': str(error)
@@ -107,7 +171,7 @@ def invalid_token_callback(error):
 
 @jwt.expired_token_loader
 def expired_token_callback(jwt_header, jwt_payload):
-    print(f"Expired token. Header: {jwt_header}, Payload: {jwt_payload}")
+    logger.debug("Expired token for identity %s", jwt_payload.get('sub'))
     return jsonify({
         'error': 'Token has expired',
         'message': 'Please log in again'
@@ -115,63 +179,99 @@ def expired_token_callback(jwt_header, jwt_payload):
 
 @jwt.unauthorized_loader
 def unauthorized_callback(error):
-    print(f"Missing token error: {error}")
+    logger.debug("Missing token error: %s", error)
     return jsonify({
         'error': 'Missing token',
         'message': str(error)
     }), 422
 
+# Short-lived cache of authenticated users (id and email) by id
+identity_cache = QuoteCache(
+    ttl=float(os.getenv('IDENTITY_CACHE_TTL', '30')),
+    max_size=int(os.getenv('IDENTITY_CACHE_SIZE', '10000'))
+)
+
+register_cache('identity', identity_cache.stats)
+
+def current_user():
+    return resolve_current_user(identity_cache)
+
+# bcrypt runs on its own bounded pool; bursts beyond its queue get a 429
+password_hasher = PasswordHasher(
+    rounds=int(os.getenv('BCRYPT_ROUNDS', '12')),
+    workers=int(os.getenv('BCRYPT_WORKERS', '2')),
+    max_queue=int(os.getenv('BCRYPT_MAX_QUEUE', '6'))
+)
+
+def busy_response():
+    response = jsonify({'error': 'Too many sign-in requests, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
 @app.route('/api/register', methods=['POST'])
 def register():
-    print("Received registration request")
     data = request.get_json()
-    print("Request data:", data)
     
     if not data or 'email' not in data or 'password' not in data:
-        print("Missing email or password in request")
+        logger.debug("Missing email or password in registration request")
         return jsonify({'error': 'Email and password are required'}), 400
     
     if User.query.filter_by(email=data['email']).first():
-        print(f"Email {data['email']} already exists")
+        logger.debug("Email %s already exists", data['email'])
         return jsonify({'error': 'Email already exists'}), 400
     
     try:
-        hashed_password = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+        hashed_password = password_hasher.hash(data['password'])
+    except HasherBusy:
+        return busy_response()
+    
+    try:
         
         new_user = User(
             email=data['email'],
             password=hashed_password,
-            virtual_balance=1000000  # Starting balance of $1M
+            virtual_balance=STARTING_BALANCE
         )
         
         db.session.add(new_user)
         db.session.commit()
-        print(f"Successfully created user with email {data['email']}")
+        logger.info("Created user with email %s", data['email'])
         return jsonify({'message': 'User created successfully'}), 201
     except Exception as e:
-        print(f"Error creating user: {str(e)}")
+        logger.exception("Error creating user")
         db.session.rollback()
         return jsonify({'error': 'Failed to create user'}), 500
 
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.get_json()
-    print(f"Login attempt for email: {data.get('email')}")
+    logger.debug("Login attempt for email: %s", data.get('email'))
     
     user = User.query.filter_by(email=data['email']).first()
-    print(f"User found: {user is not None}")
     
     if user:
         try:
-            password_matches = bcrypt.checkpw(data['password'].encode('utf-8'), user.password)
-            print(f"Password match: {password_matches}")
+            password_matches = password_hasher.check(data['password'], user.password)
             
+        except HasherBusy:
+            return busy_response()
         except Exception as e:
-            print(f"Error checking password: {str(e)}")
+            logger.exception("Error checking password")
             return jsonify({'error': 'Server error during login'}), 500
             
         if password_matches:
-            access_token = create_access_token(identity=str(user.email))
+            # Upgrade hashes made with an older cost while we have the password
+            if password_hasher.needs_rehash(user.password):
+                try:
+                    user.password = password_hasher.hash(data['password'])
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning("Could not rehash password: %s", e)
+            access_token = create_access_token(
+                identity=str(user.id),
+                additional_claims={'email': user.email}
+            )
             return jsonify({
                 'access_token': access_token,
                 'user': {
@@ -182,60 +282,107 @@ def login():
     
     return jsonify({'error': 'Invalid credentials'}), 401
 
+STOCK_FIELDS = ('prices', 'dates', 'info')
+
+def session_ttl(symbol, intraday_ttl):
+    """Cache lifetime for a symbol's price data: intraday_ttl during a
+    session, until the next open once the market has closed"""
+    if not market_hours.follows_sessions(symbol):
+        return intraday_ttl
+    return market_hours.session_ttl(intraday_ttl)
+
+def fetch_stock_info(symbol):
+    return scheduler.call('info', lambda: yf.Ticker(symbol).info)
+
+# Company info for /api/stock, kept like quotes: short-lived during a session
+# and until the next open once the market has closed
+INFO_CACHE_TTL = float(os.getenv('INFO_CACHE_TTL', '60'))
+info_cache = QuoteCache(
+    ttl=lambda symbol: session_ttl(symbol, INFO_CACHE_TTL),
+    max_size=int(os.getenv('INFO_CACHE_SIZE', '512'))
+)
+
+register_cache('stock_info', info_cache.stats)
+
 @app.route('/api/stock/<symbol>', methods=['GET'])
 def get_stock_data(symbol):
     try:
         period = request.args.get('period', '1d')
         interval = request.args.get('interval', '5m')
-        stock = yf.Ticker(symbol)
+        try:
+            # info is opt-in for compact responses: it is most of the payload
+            compact, encoding, fields = parse_options(request.args, STOCK_FIELDS, ('prices', 'dates'))
+            points = parse_points(request.args)
+            period_days(period)
+        except ValueError as e:  # PayloadError or an invalid period
+            return jsonify({'error': str(e)}), 400
         
-        # Get historical data with interval
-        hist = stock.history(period=period, interval=interval)
+        # Get historical data with interval from the local bar store
+        hist = bar_store.history(symbol, period=period, interval=interval)
         
         if hist.empty:
             return jsonify({'error': 'No data available for this period'}), 404
         
+        if compact or points:
+            hist = hist.dropna(subset=['Close'])
+        if points:
+            hist = hist.iloc[downsample_indices(hist['Close'].to_numpy(), points)]
+        
         # Format data for frontend
-        data = {
-            'prices': hist['Close'].tolist(),
-            'dates': hist.index.strftime('%Y-%m-%d %H:%M:%S').tolist(),
-            'info': stock.info
-        }
+        data = {}
+        if compact:
+            if 'prices' in fields:
+                data['prices'] = encode_series(hist['Close'].to_numpy(), encoding, decimals=4)
+            if 'dates' in fields:
+                data.update(encode_times(hist.index))
+        else:
+            if 'prices' in fields:
+                data['prices'] = hist['Close'].tolist()
+            if 'dates' in fields:
+                data['dates'] = hist.index.strftime('%Y-%m-%d %H:%M:%S').tolist()
+        if 'info' in fields:
+            data['info'] = info_cache.get(symbol.upper(), fetch_stock_info)
         
         return jsonify(data)
     except Exception as e:
-        print(f"Error fetching stock data: {str(e)}")
+        logger.warning("Error fetching stock data for %s: %s", symbol, e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/portfolio', methods=['GET'])
 @jwt_required()
 def get_portfolio():
     try:
-        # Get email from JWT token
-        email = get_jwt_identity()
-        print(f"Getting portfolio for email: {email}")
+        # Resolve the user from the JWT (cached by id)
+        try:
+            user = current_user()
+        except UserNotFound:
+            logger.info("No user found for identity: %s", get_jwt_identity())
+            return jsonify({'error': 'User not found'}), 404
         
-        # Find user by email
-        user = User.query.filter_by(email=email).first()
-        if not user:
-            print(f"No user found for email: {email}")
+        # Read the balance together with the positions so both reflect the same trades
+        rows = (db.session.query(User.virtual_balance, Portfolio)
+                .outerjoin(Portfolio, Portfolio.user_id == User.id)
+                .filter(User.id == user.id)
+                .all())
+        if not rows:
             return jsonify({'error': 'User not found'}), 404
-            
-        print(f"Found user ID: {user.id}")
+        cash_balance = rows[0][0]
+        portfolio_items = [item for _, item in rows if item is not None]
+        logger.debug("Found %d portfolio items for user %s", len(portfolio_items), user.id)
         
-        # Get portfolio items
-        portfolio_items = Portfolio.query.filter_by(user_id=user.id).all()
-        print(f"Found {len(portfolio_items)} portfolio items")
+        # Resolve every position's price in one parallel batch
+        prices = get_stock_prices([item.symbol for item in portfolio_items])
         
         # Initialize response data
         portfolio_data = []
-        total_value = user.virtual_balance
+        total_value = cash_balance
         
         # Process each portfolio item
         for item in portfolio_items:
             try:
-                print(f"Processing {item.symbol}")
-                current_price = get_stock_price(item.symbol)
+                current_price = prices[item.symbol]
+                if isinstance(current_price, Exception):
+                    raise current_price
                 
                 # Calculate values
                 value = item.shares * current_price
@@ -251,10 +398,9 @@ def get_portfolio():
                     'value': float(value),
                     'gain_loss': float(gain_loss)
                 })
-                print(f"Added {item.symbol} to portfolio data")
                 
             except ValueError as e:
-                print(f"Could not get price for {item.symbol}: {e}")
+                logger.warning("Could not get price for %s: %s", item.symbol, e)
                 # Add to portfolio with unavailable price
                 portfolio_data.append({
                     'symbol': item.symbol,
@@ -265,220 +411,402 @@ def get_portfolio():
                     'gain_loss': 'N/A'
                 })
             except Exception as e:
-                print(f"Error processing {item.symbol}: {str(e)}")
+                logger.exception("Error processing %s", item.symbol)
                 continue
         
         # Prepare response
         response_data = {
             'portfolio': portfolio_data,
             'total_value': float(total_value),
-            'cash_balance': float(user.virtual_balance)
+            'cash_balance': float(cash_balance)
         }
-        
-        print("Final response data:", response_data)
         return jsonify(response_data)
         
     except Exception as e:
-        print(f"Portfolio error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Portfolio error")
         return jsonify({'error': str(e)}), 500
 
+# In-memory symbol search, rebuilt when the companies table changes
+def load_companies():
+    return Company.query.with_entities(Company.symbol, Company.name).all()
+
+# Fingerprint of every (symbol, name) pair, so renames trigger a rebuild too
+COMPANIES_FINGERPRINT_PG = text(
+    "SELECT count(*), md5(string_agg(symbol || ':' || name, ',' ORDER BY symbol)) FROM companies"
+)
+
+def companies_version():
+    if db.engine.dialect.name == 'postgresql':
+        return tuple(db.session.execute(COMPANIES_FINGERPRINT_PG).one())
+    # Other databases (SQLite in development) hash the pairs here
+    digest = hashlib.md5()
+    for symbol, name in Company.query.with_entities(Company.symbol, Company.name).order_by(Company.symbol):
+        digest.update(f"{symbol}:{name},".encode())
+    return digest.hexdigest()
+
+search_engine = SearchEngine(
+    load_companies,
+    version=companies_version,
+    refresh_interval=float(os.getenv('SEARCH_INDEX_REFRESH', '300'))
+)
+
+@app.route('/api/portfolio/history', methods=['GET'])
+@jwt_required()
+def get_portfolio_history():
+    period = request.args.get('period', '1mo')
+    if period not in HISTORY_PERIODS:
+        return jsonify({'error': f"Invalid period. Use one of: {', '.join(HISTORY_PERIODS)}"}), 400
+
+    try:
+        user = current_user()
+    except UserNotFound:
+        return jsonify({'error': 'User not found'}), 404
+
+    snapshots = snapshot_history(user.id, period)
+    return jsonify({
+        'period': period,
+        'dates': [s.taken_at.strftime('%Y-%m-%d %H:%M:%S') for s in snapshots],
+        'total_value': [s.total_value for s in snapshots],
+        'cash': [s.cash for s in snapshots],
+        'holdings_value': [s.holdings_value for s in snapshots]
+    })
+
+@app.route('/api/transactions', methods=['GET'])
+@jwt_required()
+def get_transactions():
+    try:
+        user = current_user()
+    except UserNotFound:
+        return jsonify({'error': 'User not found'}), 404
+
+    symbol = request.args.get('symbol')
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        query = filtered_query(
+            user.id,
+            symbol=symbol,
+            action=request.args.get('action'),
+            start=request.args.get('start'),
+            end=request.args.get('end')
+        )
+        rows, next_cursor = transaction_page(query, request.args.get('cursor'), limit)
+    except (HistoryQueryError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    response_data = {
+        'transactions': [{
+            'id': t.id,
+            'symbol': t.symbol,
+            'action': t.action,
+            'shares': t.shares,
+            'price': t.price,
+            'total': t.shares * t.price,
+            'timestamp': t.timestamp.isoformat()
+        } for t in rows],
+        'next_cursor': next_cursor
+    }
+    if request.args.get('aggregates') in ('1', 'true'):
+        response_data['aggregates'] = symbol_aggregates(user.id, symbol)
+    return jsonify(response_data)
+
+def record_snapshots():
+    with upstream.priority(BACKGROUND):
+        return take_snapshots(get_stock_prices)
+
+@app.cli.command('snapshot-portfolios')
+def snapshot_portfolios_command():
+    """Record a value snapshot for every user (run at end of day)"""
+    print(f"Recorded {record_snapshots()} portfolio snapshots")
+
+# Vercel Cron calls this after each close (see vercel.json) with
+# "Authorization: Bearer $CRON_SECRET"; without CRON_SECRET it is disabled
+CRON_SECRET = os.getenv('CRON_SECRET')
+
+@app.route('/api/cron/snapshot-portfolios', methods=['GET'])
+def snapshot_portfolios_cron():
+    if not CRON_SECRET or request.headers.get('Authorization') != f'Bearer {CRON_SECRET}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        count = record_snapshots()
+    except Exception as e:
+        logger.exception("Error recording portfolio snapshots")
+        return jsonify({'error': 'Failed to record snapshots'}), 500
+    return jsonify({'snapshots': count})
+
 @app.route('/api/search', methods=['GET'])
 def search_companies():
     query = request.args.get('q', '')
     if not query:
         return jsonify([])
 
-    starts_with_term = f"{query}%"
-    contains_term = f"%{query}%"
-
-    # Prioritize matches that start with the query
-    relevance_ordering = case(
-        (Company.symbol.ilike(starts_with_term), 1),
-        (Company.name.ilike(starts_with_term), 2),
-        (Company.symbol.ilike(contains_term), 3),
-        (Company.name.ilike(contains_term), 4),
-        else_=5 
-    )
-
-    results = Company.query.filter(
-        or_(
-            Company.symbol.ilike(contains_term),
-            Company.name.ilike(contains_term)
-        )
-    ).order_by(relevance_ordering, Company.name).limit(10).all()
+    results = search_engine.search(query, limit=10)
     
-    companies = [{'symbol': c.symbol, 'name': c.name} for c in results]
+    companies = [{'symbol': symbol, 'name': name} for symbol, name in results]
     
     return jsonify(companies)
 
+# Shared quote cache so concurrent requests for the same symbol hit yfinance once.
+# Quotes live QUOTE_CACHE_TTL seconds during a session and until the next open
+# once the market has closed, so nights and weekends cost no upstream calls.
+QUOTE_CACHE_TTL = float(os.getenv('QUOTE_CACHE_TTL', '15'))
+quote_cache = QuoteCache(
+    ttl=lambda symbol: session_ttl(symbol, QUOTE_CACHE_TTL),
+    max_size=int(os.getenv('QUOTE_CACHE_SIZE', '2048'))
+)
+
+register_cache('quotes', quote_cache.stats)
+
 def get_stock_price(symbol):
+    """Get current stock price, served from the shared quote cache when fresh"""
+    return quote_cache.get(symbol.upper(), fetch_stock_price)
+
+# Bounded pool for resolving many symbols at once
+PRICE_FETCH_WORKERS = int(os.getenv('PRICE_FETCH_WORKERS', '8'))
+PRICE_FETCH_TIMEOUT = float(os.getenv('PRICE_FETCH_TIMEOUT', '6'))
+price_executor = ThreadPoolExecutor(max_workers=PRICE_FETCH_WORKERS)
+
+def get_stock_prices(symbols, timeout=PRICE_FETCH_TIMEOUT):
+    """Get prices for many symbols in parallel.
+
+    Returns {symbol: price or exception}; symbols that fail or miss the
+    deadline map to a ValueError instead of failing the whole batch.
+    """
+    unique = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+    resolved = {}
+    futures = {}
+    for symbol in unique:
+        cached = quote_cache.peek(symbol)
+        if cached is not None:
+            resolved[symbol] = cached
+        else:
+            futures[symbol] = upstream.submit(price_executor, get_stock_price, symbol)
+
+    deadline = time.monotonic() + timeout
+    for symbol, future in futures.items():
+        try:
+            resolved[symbol] = future.result(timeout=max(0, deadline - time.monotonic()))
+        except FuturesTimeoutError:
+            resolved[symbol] = ValueError(f"Timed out fetching price for {symbol}")
+        except ValueError as e:
+            resolved[symbol] = e
+        except Exception as e:
+            resolved[symbol] = ValueError(f"Failed to fetch price for {symbol}: {str(e)}")
+
+    return {symbol: resolved[symbol.upper()] for symbol in symbols}
+
+def fetch_stock_price(symbol):
     """Get current stock price with multiple fallback methods"""
     try:
         stock = yf.Ticker(symbol)
+        info = scheduler.call('info', lambda: stock.info)
         
         # Method 1: Try regular market price
-        price = stock.info.get('regularMarketPrice')
+        price = info.get('regularMarketPrice')
         if price:
             return price
             
         # Method 2: Try current price
-        price = stock.info.get('currentPrice')
+        price = info.get('currentPrice')
         if price:
             return price
             
         # Method 3: Try last close price from history
-        hist = stock.history(period='1d')
+        hist = scheduler.call('history', stock.history, period='1d')
         if not hist.empty and 'Close' in hist.columns:
             return float(hist['Close'].iloc[-1])
             
         # Method 4: Try fast info
-        fast_info = stock.fast_info
-        if hasattr(fast_info, 'last_price') and fast_info.last_price:
-            return float(fast_info.last_price)
+        last_price = scheduler.call('fast_info', lambda: getattr(stock.fast_info, 'last_price', None))
+        if last_price:
+            return float(last_price)
             
         raise ValueError(f"Could not fetch price for {symbol} using any method")
         
     except Exception as e:
-        print(f"Error fetching price for {symbol}: {str(e)}")
+        logger.warning("Error fetching price for %s: %s", symbol, e)
         raise ValueError(f"Failed to fetch price for {symbol}: {str(e)}")
 
+@app.route('/api/quotes/stats', methods=['GET'])
+def quote_cache_stats():
+    return jsonify(quote_cache.stats())
+
+# Live quotes: one upstream poller per watched symbol, fanned out over SSE
+MAX_STREAM_SYMBOLS = 20
+
+# Streamable symbols besides listed companies: the benchmark indices and major crypto
+STREAM_EXTRA_SYMBOLS = {s.strip().upper() for s in os.getenv(
+    'STREAM_EXTRA_SYMBOLS', '^GSPC,^IXIC,^DJI,BTC-USD,ETH-USD').split(',') if s.strip()}
+
+def poll_stock_price(symbol):
+    with upstream.priority(BACKGROUND):
+        if not market_hours.is_open() and market_hours.follows_sessions(symbol):
+            # The last price holds until the open; refetch only once it expires
+            return quote_cache.get(symbol, fetch_stock_price)
+        price = fetch_stock_price(symbol)
+    quote_cache.set(symbol, price)
+    return price
+
+quote_hub = QuoteHub(
+    poll_stock_price,
+    interval=float(os.getenv('QUOTE_STREAM_INTERVAL', '5')),
+    max_pollers=int(os.getenv('QUOTE_STREAM_MAX_POLLERS', '200'))
+)
+
+@app.route('/api/stream/quotes', methods=['GET'])
+def stream_quotes():
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    if not symbols:
+        return jsonify({'error': 'No symbols provided'}), 400
+    if len(symbols) > MAX_STREAM_SYMBOLS:
+        return jsonify({'error': f'At most {MAX_STREAM_SYMBOLS} symbols can be streamed'}), 400
+    unknown = [s for s in symbols if s not in STREAM_EXTRA_SYMBOLS and not search_engine.has_symbol(s)]
+    if unknown:
+        return jsonify({'error': f"Unknown symbols: {', '.join(unknown)}"}), 400
+
+    try:
+        subscription = quote_hub.subscribe(symbols)
+    except HubFull:
+        return jsonify({'error': 'Too many quote streams, try again later'}), 503, {'Retry-After': '30'}
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                event = subscription.next(timeout=15)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                else:
+                    yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            quote_hub.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
 @app.route('/api/trade', methods=['POST'])
 @jwt_required()
 def trade():
     try:
-        # Get email from JWT token
-        email = get_jwt_identity()
-        print(f"Processing trade for email: {email}")
-        
-        # Find user by email
-        user = User.query.filter_by(email=email).first()
-        if not user:
-            print(f"No user found for email: {email}")
+        # Resolve the user from the JWT (cached by id)
+        try:
+            user = current_user()
+        except UserNotFound:
+            logger.info("No user found for identity: %s", get_jwt_identity())
             return jsonify({'error': 'User not found'}), 404
             
-        print(f"Found user ID: {user.id}")
+        user_id = user.id
+        # Release the connection while the price is fetched
+        db.session.rollback()
         
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-            
-        if 'symbol' not in data or 'action' not in data or 'shares' not in data:
-            return jsonify({'error': 'Missing required fields'}), 400
-            
         try:
-            shares = int(data['shares'])
-            if shares <= 0:
-                return jsonify({'error': 'Number of shares must be positive'}), 400
-        except ValueError:
-            return jsonify({'error': 'Invalid number of shares'}), 400
+            symbol, action, shares = parse_order(request.get_json())
+        except TradeError as e:
+            return jsonify(e.to_dict()), e.status
         
         try:
-            current_price = get_stock_price(data['symbol'])
-            print(f"Fetched price for {data['symbol']}: ${current_price}")
+            current_price = get_stock_price(symbol)
         except ValueError as e:
             return jsonify({'error': str(e)}), 400
         except Exception as e:
-            print(f"Unexpected error fetching price: {str(e)}")
+            logger.exception("Unexpected error fetching price for %s", symbol)
             return jsonify({'error': 'Failed to fetch stock price'}), 500
             
         total_cost = current_price * shares
-        print(f"Calculated total cost: ${total_cost}")
-        
-        # Start transaction
-        db.session.begin_nested()
         
         try:
-            if data['action'] == 'buy':
-                if total_cost > user.virtual_balance:
-                    db.session.rollback()
-                    return jsonify({
-                        'error': 'Insufficient funds',
-                        'required': total_cost,
-                        'available': user.virtual_balance
-                    }), 400
-                
-                portfolio_item = Portfolio.query.filter_by(
-                    user_id=user.id, symbol=data['symbol']).first()
-                
-                if portfolio_item:
-                    new_shares = portfolio_item.shares + shares
-                    new_avg_price = ((portfolio_item.shares * portfolio_item.average_price) + 
-                                   (shares * current_price)) / new_shares
-                    portfolio_item.shares = new_shares
-                    portfolio_item.average_price = new_avg_price
-                else:
-                    portfolio_item = Portfolio(
-                        user_id=user.id,
-                        symbol=data['symbol'],
-                        shares=shares,
-                        average_price=current_price
-                    )
-                    db.session.add(portfolio_item)
-                
-                user.virtual_balance -= total_cost
-                print(f"Updated user balance: ${user.virtual_balance}")
-                
-            elif data['action'] == 'sell':
-                portfolio_item = Portfolio.query.filter_by(
-                    user_id=user.id, symbol=data['symbol']).first()
-                
-                if not portfolio_item:
-                    db.session.rollback()
-                    return jsonify({'error': 'You do not own this stock'}), 400
-                    
-                if shares > portfolio_item.shares:
-                    db.session.rollback()
-                    return jsonify({'error': 'Not enough shares to sell'}), 400
-                    
-                user.virtual_balance += total_cost
-                print(f"Updated user balance: ${user.virtual_balance}")
-                
-                if shares == portfolio_item.shares:
-                    db.session.delete(portfolio_item)
-                else:
-                    portfolio_item.shares -= shares
-            
-            # Create transaction record
-            transaction = Transaction(
-                user_id=user.id,
-                symbol=data['symbol'],
-                shares=shares,
-                price=current_price,
-                action=data['action'],
-                timestamp=datetime.now(timezone.utc)
-            )
-            
-            db.session.add(transaction)
+            transaction = apply_order(user_id, symbol, action, shares, current_price)
+            new_balance = current_balance(user_id)
+            db.session.commit()
+        except TradeError as e:
+            db.session.rollback()
+            return jsonify(e.to_dict()), e.status
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Error during trade execution")
+            return jsonify({'error': 'Failed to execute trade'}), 500
+        
+        logger.debug("Transaction %s committed", transaction.id)
+        return jsonify({
+            'message': f'Successfully executed {action} order',
+            'transaction': {
+                'symbol': symbol,
+                'shares': shares,
+                'price': current_price,
+                'total': total_cost,
+                'new_balance': new_balance
+            }
+        })
             
+    except Exception as e:
+        logger.exception("Unexpected error in trade endpoint")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+
+MAX_BATCH_ORDERS = 50
+
+@app.route('/api/trades/batch', methods=['POST'])
+@jwt_required()
+def trade_batch():
+    """Execute a list of orders in one database transaction: all or nothing"""
+    try:
+        try:
+            user = current_user()
+        except UserNotFound:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
+        db.session.rollback()
+
+        data = request.get_json()
+        orders = data.get('orders') if isinstance(data, dict) else None
+        if not orders or not isinstance(orders, list):
+            return jsonify({'error': 'A non-empty list of orders is required'}), 400
+        if len(orders) > MAX_BATCH_ORDERS:
+            return jsonify({'error': f'At most {MAX_BATCH_ORDERS} orders per batch'}), 400
+
+        parsed = []
+        for index, order in enumerate(orders):
             try:
-                db.session.commit()
-                print(f"Transaction committed successfully. ID: {transaction.id}")
-                
-                return jsonify({
-                    'message': f'Successfully executed {data["action"]} order',
-                    'transaction': {
-                        'symbol': data['symbol'],
-                        'shares': shares,
-                        'price': current_price,
-                        'total': total_cost,
-                        'new_balance': user.virtual_balance
-                    }
+                parsed.append(parse_order(order))
+            except TradeError as e:
+                return jsonify({**e.to_dict(), 'index': index}), e.status
+
+        # Price every order before the transaction opens
+        prices = get_stock_prices([symbol for symbol, _, _ in parsed])
+        for index, (symbol, _, _) in enumerate(parsed):
+            if isinstance(prices[symbol], Exception):
+                return jsonify({'error': str(prices[symbol]), 'index': index}), 400
+
+        executed = []
+        try:
+            for index, (symbol, action, shares) in enumerate(parsed):
+                try:
+                    apply_order(user_id, symbol, action, shares, prices[symbol])
+                except TradeError as e:
+                    db.session.rollback()
+                    return jsonify({**e.to_dict(), 'index': index}), e.status
+                executed.append({
+                    'symbol': symbol,
+                    'action': action,
+                    'shares': shares,
+                    'price': prices[symbol],
+                    'total': prices[symbol] * shares
                 })
-                
-            except Exception as e:
-                db.session.rollback()
-                print(f"Error committing transaction: {str(e)}")
-                return jsonify({'error': 'Database error while executing trade'}), 500
-                
+            new_balance = current_balance(user_id)
+            db.session.commit()
         except Exception as e:
             db.session.rollback()
-            print(f"Error during trade execution: {str(e)}")
-            return jsonify({'error': 'Failed to execute trade'}), 500
-            
+            logger.exception("Error during batch trade execution")
+            return jsonify({'error': 'Failed to execute trades'}), 500
+
+        return jsonify({
+            'message': f'Successfully executed {len(executed)} orders',
+            'transactions': executed,
+            'new_balance': new_balance
+        })
+
     except Exception as e:
-        print(f"Unexpected error in trade endpoint: {str(e)}")
+        logger.exception("Unexpected error in batch trade endpoint")
         return jsonify({'error': 'An unexpected error occurred'}), 500
 
 @app.route('/api/test-auth', methods=['GET'])
@@ -497,29 +825,59 @@ def testingbackend():
 # Set this to your deployed backend-datahandle URL
 DATAHANDLE_URL = os.getenv('DATAHANDLE_URL')
 
-def get_comparison_data(symbol, period="1y"):
-    url = f"{DATAHANDLE_URL}/api/comparison/{symbol}"
-    params = {"period": period}
+# Pooled, coalescing client for the datahandle service
+datahandle = GatewayClient(
+    DATAHANDLE_URL,
+    timeout=10,
+    cache_ttl=float(os.getenv('DATAHANDLE_CACHE_TTL', '5'))
+)
+
+register_cache('datahandle', datahandle.stats)
+
+def get_datahandle(path, params=None):
     try:
-        response = requests.get(url, params=params, timeout=10)
-        return response.json(), response.status_code
+        return datahandle.get(path, params)
+    except CircuitOpenError:
+        logger.warning("Datahandle circuit open, failing fast")
+        return {"error": "Data service unavailable"}, 503
     except Exception as e:
-        print(f"Error contacting datahandle service: {e}")
+        logger.warning("Error contacting datahandle service: %s", e)
         return {"error": "Data service unavailable"}, 503
+
+# Payload options passed through to the data service unchanged
+CHART_OPTIONS = ('format', 'encoding', 'fields', 'points')
+
+def get_comparison_data(symbol, period="1y", benchmark="^GSPC", options=None):
+    params = {"period": period, "benchmark": benchmark, **(options or {})}
+    return get_datahandle(f"/api/comparison/{symbol}", params)
+
+def get_multi_comparison_data(symbols, period="1y", benchmark="^GSPC", points=None):
+    params = {"symbols": symbols, "period": period, "benchmark": benchmark}
+    if points:
+        params["points"] = points
+    return get_datahandle("/api/comparison", params)
     
 def get_dashboard_data(symbol):
-    url = f"{DATAHANDLE_URL}/api/dashboard/{symbol}"
-    try:
-        response = requests.get(url, timeout=10)
-        return response.json(), response.status_code
-    except Exception as e:
-        print(f"Error contacting datahandle service: {e}")
-        return {"error": "Data service unavailable"}, 503
+    return get_datahandle(f"/api/dashboard/{symbol}")
+
+def get_fundamentals_data(symbol, quarters=None):
+    params = {"quarters": quarters} if quarters else None
+    return get_datahandle(f"/api/fundamentals/{symbol}", params)
 
 @app.route('/api/comparison/<symbol>', methods=['GET'])
 def proxy_comparison(symbol):
     period = request.args.get('period', '1y')
-    data, status = get_comparison_data(symbol, period)
+    benchmark = request.args.get('benchmark', '^GSPC')
+    options = {key: request.args[key] for key in CHART_OPTIONS if key in request.args}
+    data, status = get_comparison_data(symbol, period, benchmark, options)
+    return jsonify(data), status
+
+@app.route('/api/comparison', methods=['GET'])
+def proxy_multi_comparison():
+    symbols = request.args.get('symbols', '')
+    period = request.args.get('period', '1y')
+    benchmark = request.args.get('benchmark', '^GSPC')
+    data, status = get_multi_comparison_data(symbols, period, benchmark, request.args.get('points'))
     return jsonify(data), status
 
 @app.route('/api/dashboard/<symbol>', methods=['GET'])
@@ -527,5 +885,10 @@ def proxy_dashboard(symbol):
     data, status = get_dashboard_data(symbol)
     return jsonify(data), status
 
+@app.route('/api/fundamentals/<symbol>', methods=['GET'])
+def proxy_fundamentals(symbol):
+    data, status = get_fundamentals_data(symbol, request.args.get('quarters'))
+    return jsonify(data), status
+
 if __name__ == '__main__':
     app.run(debug=True)
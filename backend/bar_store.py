@@ -0,0 +1,316 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import market_hours
+from lazy import lazy_import
+from metrics import register_cache
+from upstream import scheduler, yf
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Approximate span of each yfinance period, used to decide whether the stored
+# history already covers a request or needs a deeper backfill
+PERIOD_DAYS = {
+    '1d': 1, '5d': 5, '1mo': 31, '3mo': 92, '6mo': 183, 'ytd': 366,
+    '1y': 366, '2y': 731, '5y': 1827, '10y': 3653, 'max': float('inf'),
+}
+
+# How far back yfinance serves each intraday interval, in days
+INTRADAY_LOOKBACK_DAYS = {
+    '1m': 7, '2m': 60, '5m': 60, '15m': 60, '30m': 60, '60m': 730, '90m': 60, '1h': 730,
+}
+
+INTERVAL_SECONDS = {
+    '1m': 60, '2m': 120, '5m': 300, '15m': 900, '30m': 1800, '60m': 3600,
+    '90m': 5400, '1h': 3600, '1d': 86400, '5d': 432000, '1wk': 604800,
+    '1mo': 2592000, '3mo': 7776000,
+}
+
+
+# Longest a stored series is served during a session before its tail is refetched
+INTRADAY_REFRESH = float(os.getenv('BAR_INTRADAY_REFRESH', '60'))
+
+
+def period_days(period):
+    """Approximate span of a yfinance period in days, including counted
+    periods such as '60d' or '3y'"""
+    if period in PERIOD_DAYS:
+        return PERIOD_DAYS[period]
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', period)
+    if not match:
+        raise ValueError(f"Invalid period: {period}")
+    count, unit = int(match.group(1)), match.group(2)
+    return count * {'d': 1, 'wk': 7, 'mo': 31, 'y': 366}[unit]
+
+
+def _tail_reachable(interval, last_ts, now):
+    """False if the bars after last_ts are older than yfinance still serves
+    for interval, so only a full fetch can bring the series up to date"""
+    lookback = INTRADAY_LOOKBACK_DAYS.get(interval)
+    return lookback is None or now - last_ts < (lookback - 1) * 86400
+
+
+def _missed_bars(symbol, interval, last_ts, now):
+    """True if bars must exist after last_ts: a whole session has closed
+    since its day (or, for round-the-clock symbols, more than a day or two
+    bars have passed)"""
+    if market_hours.follows_sessions(symbol):
+        last_day = datetime.fromtimestamp(last_ts, market_hours.EXCHANGE_TZ).date()
+        return market_hours.previous_close().date() > last_day
+    return now - last_ts > max(86400, 2 * INTERVAL_SECONDS.get(interval, 86400))
+
+
+def _is_current(symbol, interval, fetched_at):
+    """True if a series fetched at fetched_at needs no refetch. During a
+    session (and while its close settles) that lasts one bar or
+    INTRADAY_REFRESH seconds, whichever is shorter, so today's bar keeps
+    moving; once the market has closed, bars fetched after the settled close
+    stay complete until the next open."""
+    if market_hours.in_session() or not market_hours.follows_sessions(symbol):
+        return time.time() - fetched_at < min(INTERVAL_SECONDS.get(interval, 86400), INTRADAY_REFRESH)
+    return market_hours.unchanged_since(fetched_at)
+
+
+def _safe_name(text):
+    return re.sub(r'[^A-Za-z0-9^=._-]', '_', text)
+
+
+class _Series:
+    """Column arrays for one (symbol, interval) plus fetch metadata"""
+    def __init__(self, ts, columns, tz, period, fetched_at):
+        self.ts = ts
+        self.columns = columns
+        self.tz = tz
+        self.period = period
+        self.fetched_at = fetched_at
+
+
+class BarStore:
+    """On-disk OHLCV store keyed by (symbol, interval).
+
+    Each series is kept as one .npz file of column arrays (epoch seconds plus
+    Open/High/Low/Close/Volume). Requests are served from the stored arrays;
+    only the bars after the last stored one are fetched from yfinance, and a
+    full refetch happens only when a longer period is asked for than has been
+    stored so far or the provider has re-adjusted past prices.
+    """
+
+    def __init__(self, root, max_loaded=256):
+        self.root = root
+        self.max_loaded = max_loaded
+        self._loaded = OrderedDict()
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.root, f"{_safe_name(symbol)}__{_safe_name(interval)}.npz")
+
+    def _load(self, symbol, interval):
+        key = (symbol, interval)
+        series = self._loaded.get(key)
+        if series is not None:
+            self._loaded.move_to_end(key)
+            return series
+
+        path = self._path(symbol, interval)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                series = _Series(
+                    ts=data['ts'],
+                    columns={name: data[name] for name in COLUMNS},
+                    tz=str(data['tz']),
+                    period=str(data['period']),
+                    fetched_at=float(data['fetched_at'])
+                )
+        except Exception as e:
+            logger.warning("Discarding unreadable bar file %s: %s", path, e)
+            return None
+        self._remember(key, series)
+        return series
+
+    def _remember(self, key, series):
+        self._loaded[key] = series
+        self._loaded.move_to_end(key)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+
+    def _save(self, symbol, interval, series):
+        path = self._path(symbol, interval)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                ts=series.ts,
+                tz=np.array(series.tz),
+                period=np.array(series.period),
+                fetched_at=np.array(series.fetched_at),
+                **series.columns
+            )
+        os.replace(tmp_path, path)
+        self._remember((symbol, interval), series)
+
+    @staticmethod
+    def _from_frame(hist):
+        index = hist.index
+        if index.tz is None:
+            index = index.tz_localize('UTC')
+        ts = index.tz_convert('UTC').as_unit('s').asi8.astype(np.int64)
+        columns = {name: hist[name].to_numpy(dtype=np.float64) for name in COLUMNS}
+        return ts, columns, str(index.tz)
+
+    @staticmethod
+    def _merge(series, ts, columns):
+        """Append fetched bars, letting them replace stored bars at the same time"""
+        keep = series.ts < ts[0] if len(ts) else np.ones(len(series.ts), dtype=bool)
+        merged_ts = np.concatenate([series.ts[keep], ts])
+        merged = {name: np.concatenate([series.columns[name][keep], columns[name]])
+                  for name in COLUMNS}
+        return merged_ts, merged
+
+    @staticmethod
+    def _adjusted(series, ts, columns):
+        """True if the provider's prices for an overlapping bar have changed,
+        e.g. after a split or dividend adjustment"""
+        if not len(ts) or not len(series.ts):
+            return False
+        pos = np.searchsorted(series.ts, ts[0])
+        if pos >= len(series.ts) or series.ts[pos] != ts[0]:
+            return False
+        stored_open = series.columns['Open'][pos]
+        fetched_open = columns['Open'][0]
+        if not stored_open or np.isnan(stored_open) or np.isnan(fetched_open):
+            return False
+        return abs(fetched_open - stored_open) / abs(stored_open) > 1e-3
+
+    def _fetch_full(self, symbol, period, interval):
+        hist = scheduler.call('history', yf.Ticker(symbol).history, period=period, interval=interval)
+        if hist.empty:
+            return None
+        ts, columns, tz = self._from_frame(hist)
+        return _Series(ts, columns, tz, period, time.time())
+
+    def _refresh(self, symbol, period, interval, series):
+        """Bring the stored series up to date for this request"""
+        now = time.time()
+        covered = series is not None and period_days(series.period) >= period_days(period)
+
+        if not covered:
+            self._count(hit=False)
+            fresh = self._fetch_full(symbol, period, interval)
+            if fresh is None:
+                return series
+            if series is not None and len(series.ts):
+                # Keep stored bars newer than the fetched window
+                newer = series.ts > fresh.ts[-1]
+                fresh.ts = np.concatenate([fresh.ts, series.ts[newer]])
+                fresh.columns = {name: np.concatenate([fresh.columns[name], series.columns[name][newer]])
+                                 for name in COLUMNS}
+            return fresh
+
+        if _is_current(symbol, interval, series.fetched_at):
+            self._count(hit=True)
+            return series
+        self._count(hit=False)
+
+        if not len(series.ts) or not _tail_reachable(interval, int(series.ts[-1]), now):
+            return self._fetch_full(symbol, series.period, interval) or series
+
+        # Fetch only the tail, starting at the last stored bar so it is refreshed too
+        start = datetime.fromtimestamp(int(series.ts[-1]), tz=timezone.utc)
+        hist = scheduler.call('history', yf.Ticker(symbol).history, start=start, interval=interval)
+        if hist.empty:
+            if _missed_bars(symbol, interval, int(series.ts[-1]), now):
+                logger.info("No recent bars for %s (%s) from the tail; refetching %s", symbol, interval, series.period)
+                fresh = self._fetch_full(symbol, series.period, interval)
+                if fresh is not None:
+                    return fresh
+            series.fetched_at = now
+            return series
+        ts, columns, _ = self._from_frame(hist)
+        if self._adjusted(series, ts, columns):
+            logger.info("Prices for %s (%s) were re-adjusted; refetching %s", symbol, interval, series.period)
+            return self._fetch_full(symbol, series.period, interval) or series
+        merged_ts, merged = self._merge(series, ts, columns)
+        return _Series(merged_ts, merged, series.tz, series.period, now)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Requests served from stored bars (hits) vs. ones that went upstream"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'loaded': len(self._loaded)}
+
+    def history(self, symbol, period='1mo', interval='1d'):
+        """Return a yfinance-style OHLCV DataFrame for symbol over period.
+        Raises ValueError for a period yfinance doesn't understand."""
+        period_days(period)
+        symbol = symbol.upper()
+        key = (symbol, interval)
+        with self._key_lock(key):
+            series = self._load(symbol, interval)
+            try:
+                updated = self._refresh(symbol, period, interval, series)
+            except Exception as e:
+                if series is None:
+                    raise
+                logger.warning("Serving stored bars for %s (%s) after refresh error: %s", symbol, interval, e)
+                updated = series
+            if updated is None:
+                return pd.DataFrame(columns=COLUMNS)
+            if updated is not series:
+                self._save(symbol, interval, updated)
+        return self._slice(updated, period)
+
+    def stored(self, symbol, interval='1d'):
+        """Return every stored bar for symbol without contacting yfinance"""
+        symbol = symbol.upper()
+        with self._key_lock((symbol, interval)):
+            series = self._load(symbol, interval)
+        if series is None:
+            return pd.DataFrame(columns=COLUMNS)
+        return self._slice(series, 'max')
+
+    @staticmethod
+    def _slice(series, period):
+        index = pd.to_datetime(series.ts, unit='s', utc=True).tz_convert(series.tz)
+        frame = pd.DataFrame(series.columns, index=index, columns=COLUMNS)
+        if frame.empty or period == 'max':
+            return frame
+
+        if period == 'ytd':
+            start = frame.index[-1].normalize().replace(month=1, day=1)
+        elif period.endswith('d'):
+            # Day periods count trading sessions, not calendar days
+            sessions = frame.index.normalize().unique()
+            start = sessions[-min(period_days(period), len(sessions))]
+        else:
+            start = pd.Timestamp.now(tz=series.tz).normalize() - pd.Timedelta(days=period_days(period))
+        return frame[frame.index >= start]
+
+
+bar_store = BarStore(os.getenv('BAR_STORE_DIR', '/tmp/marketracker-bars'))
+register_cache('bars', bar_store.stats)
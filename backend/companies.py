@@ -1,12 +1,17 @@
 import csv
 
-COMPANY_DATA = []
-with open("nasdaq_companies.csv", newline='', encoding='utf-8') as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        COMPANY_DATA.append({
-            "name": row["Name"],
-            "symbol": row["Symbol"]
-        })
+DEFAULT_CSV_PATH = "nasdaq_companies.csv"
 
-print(f"Loaded {len(COMPANY_DATA)} companies from CSV.")
\ No newline at end of file
+
+def iter_companies(path=DEFAULT_CSV_PATH):
+    """Stream (symbol, name) pairs from the company CSV, skipping blanks and
+    repeated symbols"""
+    seen = set()
+    with open(path, newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            symbol = (row.get("Symbol") or "").strip()
+            name = (row.get("Name") or "").strip()
+            if not symbol or not name or symbol in seen:
+                continue
+            seen.add(symbol)
+            yield symbol, name[:255]
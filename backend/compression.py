@@ -0,0 +1,71 @@
+"""ETags and response compression for JSON and text responses.
+
+Successful GET responses get an ETag and answer If-None-Match with 304.
+Bodies of at least min_size bytes are then compressed with brotli when the
+client accepts it and the optional brotli package is installed, otherwise
+with gzip.
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/html', 'text/csv')
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _choose_encoding(header):
+    accepted = _accepted_encodings(header)
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def install(app, min_size=1024, gzip_level=6, brotli_quality=5):
+    """Tag and compress responses of app"""
+
+    @app.after_request
+    def tag_and_compress(response):
+        if request.method != 'GET' or response.status_code != 200 or response.is_streamed:
+            return response
+        if response.mimetype not in COMPRESSIBLE_TYPES:
+            return response
+
+        response.add_etag()
+        response.make_conditional(request)
+        if response.status_code != 200:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or response.content_length < min_size:
+            return response
+        encoding = _choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        body = response.get_data()
+        if encoding == 'br':
+            compressed = brotli.compress(body, quality=brotli_quality)
+        else:
+            compressed = gzip.compress(body, compresslevel=gzip_level)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed body differs byte-for-byte, so the tag becomes weak
+        etag, _ = response.get_etag()
+        response.set_etag(etag, weak=True)
+        return response
@@ -1,3 +1,27 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
-db = SQLAlchemy() 
\ No newline at end of file
+from metrics import registry, endpoint_label
+
+db = SQLAlchemy()
+
+db_queries = registry.histogram(
+    'db_queries_per_request', 'SQL statements executed while handling a request',
+    labels=('endpoint',), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g._db_queries = g.get('_db_queries', 0) + 1
+
+
+def install_query_metrics(app):
+    """Record how many statements each request issued, by route"""
+
+    @app.after_request
+    def record_queries(response):
+        db_queries.observe(g.pop('_db_queries', 0), endpoint=endpoint_label())
+        return response
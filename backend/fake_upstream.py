@@ -0,0 +1,158 @@
+"""A deterministic stand-in for the parts of yfinance this project uses.
+
+Enabled with UPSTREAM_FAKE=1 (see upstream.py). Prices are a smooth function
+of the bar time seeded by the symbol, so repeated and overlapping fetches
+agree bar for bar. UPSTREAM_FAKE_LATENCY adds a per-call delay in seconds and
+UPSTREAM_FAKE_ERROR_RATE makes that fraction of calls raise
+FakeRateLimitError, to exercise throttling and retries.
+"""
+import os
+import random
+import time
+import zlib
+from datetime import datetime, timezone
+
+from lazy import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+TIMEZONE = 'America/New_York'
+LATENCY = float(os.getenv('UPSTREAM_FAKE_LATENCY', '0'))
+ERROR_RATE = float(os.getenv('UPSTREAM_FAKE_ERROR_RATE', '0'))
+
+PERIOD_DAYS = {
+    '1d': 1, '5d': 7, '1mo': 31, '3mo': 92, '6mo': 183, 'ytd': 366,
+    '1y': 366, '2y': 731, '5y': 1827, '10y': 3653, 'max': 7305,
+}
+
+# pandas frequencies for daily and longer bars
+BAR_FREQUENCIES = {'1d': 'B', '5d': '5B', '1wk': 'W-MON', '1mo': 'MS', '3mo': 'QS'}
+
+INTRADAY_MINUTES = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30,
+                    '60m': 60, '90m': 90, '1h': 60}
+
+
+class FakeRateLimitError(Exception):
+    """Mimics yfinance's YFRateLimitError"""
+
+
+def _upstream_call():
+    if LATENCY:
+        time.sleep(LATENCY)
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        raise FakeRateLimitError('Too Many Requests. Rate limited. Try after a while.')
+
+
+def _seed(symbol):
+    return zlib.crc32(symbol.upper().encode()) % 10000
+
+
+def _prices(symbol, ts):
+    """Close prices for epoch-second timestamps ts"""
+    seed = _seed(symbol)
+    days = ts / 86400.0
+    base = 20 + seed % 480
+    trend = 1 + 0.0002 * (days - 19000)
+    wave = 0.15 * np.sin(days / 90 + seed) + 0.05 * np.sin(days / 7 + seed / 3)
+    noise = (np.sin(ts * 12.9898 + seed) * 43758.5453) % 1 - 0.5
+    return np.round(base * np.maximum(trend, 0.1) * (1 + wave + 0.01 * noise), 4)
+
+
+def _index(period, interval, start):
+    now = pd.Timestamp.now(tz=TIMEZONE)
+    if start is not None:
+        begin = pd.Timestamp(start).tz_convert(TIMEZONE)
+    else:
+        begin = now - pd.Timedelta(days=PERIOD_DAYS.get(period, 31))
+
+    if interval in INTRADAY_MINUTES:
+        # Regular sessions (9:30-16:00) of the last 60 weekdays
+        sessions = pd.bdate_range(now.normalize() - pd.Timedelta(days=60), now.normalize(), tz=TIMEZONE)
+        if start is None and period.endswith('d'):
+            # Day periods count sessions, so a weekend 1d still has bars
+            begin = sessions[-min(int(period[:-1]), len(sessions))]
+        step = INTRADAY_MINUTES[interval] * 60 * 10**9
+        offsets = np.arange(0, 390 * 60 * 10**9, step)
+        opens = (sessions + pd.Timedelta(hours=9, minutes=30)).as_unit('ns').asi8
+        index = pd.to_datetime(np.add.outer(opens, offsets).ravel(), utc=True).tz_convert(TIMEZONE)
+    else:
+        index = pd.date_range(begin.normalize(), now.normalize(),
+                              freq=BAR_FREQUENCIES.get(interval, 'B'), tz=TIMEZONE)
+    return index[(index >= begin) & (index <= now)]
+
+
+class _FastInfo:
+    def __init__(self, last_price):
+        self.last_price = last_price
+
+
+class Ticker:
+    def __init__(self, symbol):
+        self.ticker = symbol.upper()
+
+    def _last_price(self):
+        return float(_prices(self.ticker, np.array([time.time() // 60 * 60]))[0])
+
+    def history(self, period='1mo', interval='1d', start=None, **kwargs):
+        _upstream_call()
+        index = _index(period, interval, start)
+        ts = index.tz_convert('UTC').as_unit('s').asi8
+        close = _prices(self.ticker, ts)
+        opens = _prices(self.ticker, ts - 60)
+        return pd.DataFrame({
+            'Open': opens,
+            'High': np.maximum(opens, close) * 1.005,
+            'Low': np.minimum(opens, close) * 0.995,
+            'Close': close,
+            'Volume': (1e6 + (ts % 997) * 1e3).astype(float),
+        }, index=index)
+
+    @property
+    def info(self):
+        _upstream_call()
+        price = self._last_price()
+        return {
+            'symbol': self.ticker,
+            'longName': f'{self.ticker} Holdings (simulated)',
+            'sector': 'Technology',
+            'industry': 'Software',
+            'website': 'https://example.com',
+            'marketCap': int(price * 1e9),
+            'trailingPE': 25.0,
+            'trailingEps': round(price / 25, 2),
+            'dividendYield': 0.5,
+            'targetMeanPrice': round(price * 1.1, 2),
+            'averageAnalystRating': '2.0 - Buy',
+            'currentPrice': price,
+            'regularMarketPrice': price,
+            'regularMarketOpen': round(price * 0.99, 2),
+            'regularMarketDayHigh': round(price * 1.01, 2),
+            'regularMarketDayLow': round(price * 0.98, 2),
+            'regularMarketPreviousClose': round(price * 0.995, 2),
+            'fiftyTwoWeekHigh': round(price * 1.3, 2),
+            'fiftyTwoWeekLow': round(price * 0.7, 2),
+            'longBusinessSummary': 'Simulated company used when UPSTREAM_FAKE=1.',
+        }
+
+    @property
+    def fast_info(self):
+        _upstream_call()
+        return _FastInfo(self._last_price())
+
+    @property
+    def quarterly_income_stmt(self):
+        _upstream_call()
+        now = datetime.now(timezone.utc)
+        quarters = pd.date_range(end=pd.Timestamp(now.date()), periods=5, freq='QE')[::-1]
+        revenue = 1e9 * (1 + _seed(self.ticker) % 50) * (1 + 0.02 * np.arange(5)[::-1])
+        rows = {
+            'Total Revenue': revenue,
+            'Cost Of Revenue': revenue * 0.55,
+            'Gross Profit': revenue * 0.45,
+            'Operating Expense': revenue * 0.2,
+            'Operating Income': revenue * 0.25,
+            'Tax Provision': revenue * 0.04,
+            'Net Income': revenue * 0.18,
+        }
+        return pd.DataFrame(rows, index=quarters).T
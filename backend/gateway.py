@@ -0,0 +1,171 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CircuitOpenError(Exception):
+    """Raised when the upstream service is failing and calls are short-circuited"""
+
+
+class _Response:
+    def __init__(self, data, status, etag):
+        self.data = data
+        self.status = status
+        self.etag = etag
+        self.fetched_at = time.monotonic()
+
+
+class _InFlight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GatewayClient:
+    """HTTP client for an internal JSON service.
+
+    Keeps pooled keep-alive connections, coalesces identical concurrent GETs
+    into one upstream request, reuses successful responses for cache_ttl
+    seconds (revalidating with If-None-Match afterwards), and opens a circuit
+    breaker after failure_threshold consecutive failures so callers fail fast
+    for reset_timeout seconds.
+    """
+
+    def __init__(self, base_url, timeout=10, cache_ttl=5, pool_size=20,
+                 failure_threshold=5, reset_timeout=30, max_cached=512):
+        self.base_url = base_url.rstrip('/') if base_url else base_url
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_cached = max_cached
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._cache = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._open_until = 0.0
+        self._trial_running = False
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.revalidated = 0
+
+    # Circuit breaker
+
+    def _allow_request(self):
+        with self._lock:
+            if self._failures < self.failure_threshold:
+                return True
+            if time.monotonic() < self._open_until or self._trial_running:
+                return False
+            # Half-open: let a single trial request through
+            self._trial_running = True
+            return True
+
+    def _record(self, success):
+        with self._lock:
+            self._trial_running = False
+            if success:
+                self._failures = 0
+            else:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open_until = time.monotonic() + self.reset_timeout
+
+    def circuit_state(self):
+        with self._lock:
+            if self._failures < self.failure_threshold:
+                return 'closed'
+            return 'open' if time.monotonic() < self._open_until else 'half-open'
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'revalidated': self.revalidated,
+                'cached': len(self._cache),
+            }
+
+    # Requests
+
+    def get(self, path, params=None):
+        """GET base_url + path and return (json_data, status_code)"""
+        key = (path, tuple(sorted((params or {}).items())))
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached.fetched_at < self.cache_ttl:
+            with self._lock:
+                self.hits += 1
+            return cached.data, cached.status
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _InFlight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._fetch(key, path, params, cached)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            flight.event.set()
+
+    def _fetch(self, key, path, params, cached):
+        if not self._allow_request():
+            if cached is not None:
+                return cached.data, cached.status
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+
+        headers = {}
+        if cached is not None and cached.etag:
+            headers['If-None-Match'] = cached.etag
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params,
+                                        headers=headers, timeout=self.timeout)
+        except requests.RequestException:
+            self._record(False)
+            raise
+
+        if response.status_code == 304 and cached is not None:
+            self._record(True)
+            with self._lock:
+                self.revalidated += 1
+            cached.fetched_at = time.monotonic()
+            return cached.data, cached.status
+
+        self._record(response.status_code < 500)
+        data = response.json()
+        if response.status_code == 200:
+            self._remember(key, _Response(data, response.status_code, response.headers.get('ETag')))
+        return data, response.status_code
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._cache[key] = entry
+            if len(self._cache) > self.max_cached:
+                oldest = min(self._cache, key=lambda k: self._cache[k].fetched_at)
+                del self._cache[oldest]
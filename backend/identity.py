@@ -0,0 +1,41 @@
+from collections import namedtuple
+
+from flask_jwt_extended import get_jwt_identity
+
+from database import db
+from models import User
+
+# Plain snapshot of the user's immutable columns, safe to share across sessions
+# and processes. Mutable state such as the balance is always read from the
+# database in the request that uses it.
+CurrentUser = namedtuple('CurrentUser', ['id', 'email'])
+
+
+class UserNotFound(LookupError):
+    pass
+
+
+def _snapshot(user):
+    return CurrentUser(user.id, user.email)
+
+
+def _load_by_id(user_id):
+    row = db.session.query(User.id, User.email).filter_by(id=user_id).first()
+    if row is None:
+        raise UserNotFound(user_id)
+    return CurrentUser(*row)
+
+
+def resolve_current_user(identity_cache):
+    """Return the CurrentUser for the request's JWT, or raise UserNotFound.
+
+    Tokens carry the user id as their identity and are resolved through
+    identity_cache; older tokens that carry the email fall back to a lookup.
+    """
+    identity = get_jwt_identity()
+    if identity is not None and str(identity).isdigit():
+        return identity_cache.get(int(identity), _load_by_id)
+    user = User.query.filter_by(email=identity).first()
+    if user is None:
+        raise UserNotFound(identity)
+    return _snapshot(user)
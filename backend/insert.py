@@ -1,22 +1,135 @@
-import os 
+"""Load the company universe from CSV into the companies table.
+
+Rows are streamed into a staging table (COPY on Postgres, batched
+executemany on SQLite) and then applied as one set-based diff: new symbols
+are inserted, renamed ones updated and delisted ones deleted, all in a
+single short transaction.
+
+    python insert.py [path/to/nasdaq_companies.csv] [--no-delete]
+"""
+import argparse
+import os
+import sqlite3
+import time
+from itertools import islice
+
 from dotenv import load_dotenv
-import psycopg
-from companies import COMPANY_DATA
-
-load_dotenv()
-
-POSTGRES_URL = os.getenv("POSTGRES_URL")
-
-with psycopg.connect(POSTGRES_URL) as conn:
-    with conn.cursor() as cur:
-        for company in COMPANY_DATA:
-            cur.execute(
-                """
-                INSERT INTO companies (name, symbol)
-                VALUES (%s, %s)
-                ON CONFLICT (symbol) DO NOTHING
-                """,
-                (company["name"], company["symbol"])
-            )
+
+from companies import DEFAULT_CSV_PATH, iter_companies
+
+BATCH_SIZE = 1000
+
+STAGING_DDL = "CREATE TEMP TABLE company_staging (symbol VARCHAR(20) PRIMARY KEY, name VARCHAR(255) NOT NULL)"
+
+INSERT_NEW = """
+    INSERT INTO companies (symbol, name)
+    SELECT s.symbol, s.name FROM company_staging s
+    WHERE NOT EXISTS (SELECT 1 FROM companies c WHERE c.symbol = s.symbol)
+"""
+
+UPDATE_RENAMED = """
+    UPDATE companies SET name = (
+        SELECT s.name FROM company_staging s WHERE s.symbol = companies.symbol
+    )
+    WHERE EXISTS (
+        SELECT 1 FROM company_staging s
+        WHERE s.symbol = companies.symbol AND s.name <> companies.name
+    )
+"""
+
+DELETE_DELISTED = """
+    DELETE FROM companies
+    WHERE NOT EXISTS (SELECT 1 FROM company_staging s WHERE s.symbol = companies.symbol)
+"""
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _apply_diff(cur, delete):
+    counts = {}
+    cur.execute(INSERT_NEW)
+    counts['inserted'] = cur.rowcount
+    cur.execute(UPDATE_RENAMED)
+    counts['updated'] = cur.rowcount
+    counts['deleted'] = 0
+    if delete:
+        cur.execute(DELETE_DELISTED)
+        counts['deleted'] = cur.rowcount
+    return counts
+
+
+def load_postgres(url, rows, delete=True):
+    import psycopg
+
+    with psycopg.connect(url) as conn:
+        with conn.cursor() as cur:
+            cur.execute(STAGING_DDL)
+            staged = 0
+            with cur.copy("COPY company_staging (symbol, name) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+                    staged += 1
         conn.commit()
-print("Companies inserted!")
\ No newline at end of file
+        if not staged:
+            raise RuntimeError('No companies found in CSV; refusing to apply an empty universe')
+
+        with conn.transaction():
+            with conn.cursor() as cur:
+                counts = _apply_diff(cur, delete)
+    counts['staged'] = staged
+    return counts
+
+
+def load_sqlite(path, rows, delete=True):
+    conn = sqlite3.connect(path)
+    try:
+        cur = conn.cursor()
+        cur.execute(STAGING_DDL)
+        staged = 0
+        for batch in _batches(rows, BATCH_SIZE):
+            cur.executemany("INSERT INTO company_staging (symbol, name) VALUES (?, ?)", batch)
+            staged += len(batch)
+        if not staged:
+            raise RuntimeError('No companies found in CSV; refusing to apply an empty universe')
+
+        with conn:
+            counts = _apply_diff(cur, delete)
+    finally:
+        conn.close()
+    counts['staged'] = staged
+    return counts
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Load the company universe from CSV')
+    parser.add_argument('csv_path', nargs='?', default=DEFAULT_CSV_PATH)
+    parser.add_argument('--no-delete', action='store_true', help='Keep companies missing from the CSV')
+    args = parser.parse_args()
+
+    url = os.getenv("POSTGRES_URL") or os.getenv("DATABASE_URI")
+    if not url:
+        raise RuntimeError('Set POSTGRES_URL or DATABASE_URI')
+
+    started = time.monotonic()
+    rows = iter_companies(args.csv_path)
+    if url.startswith('sqlite:'):
+        counts = load_sqlite(url.split('sqlite:///', 1)[1], rows, delete=not args.no_delete)
+    else:
+        url = url.replace('postgresql+psycopg://', 'postgresql://', 1)
+        counts = load_postgres(url, rows, delete=not args.no_delete)
+
+    print(f"Companies loaded in {time.monotonic() - started:.1f}s: "
+          f"{counts['staged']} in CSV, {counts['inserted']} inserted, "
+          f"{counts['updated']} updated, {counts['deleted']} deleted")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+"""US equity market calendar for cache lifetimes.
+
+Regular NYSE/Nasdaq sessions run 9:30-16:00 America/New_York on weekdays
+that are not exchange holidays. Holidays are computed from their rules, so
+no calendar data has to be shipped or updated. Early closes (13:00 on a few
+days a year) are treated as full sessions, which only means a few extra
+refreshes on those afternoons.
+
+Prices cannot change while the market is closed, so anything derived from
+them can be kept until the next open: see session_ttl() and
+unchanged_since(). Quarterly statements change when a new quarter is
+is reported: see fundamentals_ttl().
+"""
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+EXCHANGE_TZ = ZoneInfo('America/New_York')
+OPEN = time(9, 30)
+CLOSE = time(16, 0)
+
+# Daily bars and closing quotes can still be corrected shortly after the bell
+SETTLE_SECONDS = 20 * 60
+
+# Companies report within about six weeks of a quarter's end, and large
+# filers within 60 days of a fiscal year's end
+REPORTING_WINDOW = timedelta(days=60)
+
+# yfinance suffixes of instruments that trade around the clock: crypto pairs,
+# currencies and futures
+ROUND_THE_CLOCK_SUFFIXES = ('-USD', '-USDT', '-EUR', '=X', '=F')
+
+
+def _nth_weekday(year, month, weekday, n):
+    """Date of the nth (1-based; -1 for last) weekday in month"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)"""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month = (h + l - 7 * m + 114) // 31
+    day = (h + l - 7 * m + 114) % 31 + 1
+    return date(year, month, day)
+
+
+def _observed(day):
+    """Saturday holidays are observed on Friday, Sunday ones on Monday"""
+    if day.weekday() == 5:
+        return day - timedelta(days=1)
+    if day.weekday() == 6:
+        return day + timedelta(days=1)
+    return day
+
+
+@lru_cache(maxsize=16)
+def holidays(year):
+    days = {
+        _nth_weekday(year, 1, 0, 3),             # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),             # Washington's Birthday
+        _easter(year) - timedelta(days=2),       # Good Friday
+        _nth_weekday(year, 5, 0, -1),            # Memorial Day
+        _observed(date(year, 7, 4)),             # Independence Day
+        _nth_weekday(year, 9, 0, 1),             # Labor Day
+        _nth_weekday(year, 11, 3, 4),            # Thanksgiving
+        _observed(date(year, 12, 25)),           # Christmas
+    }
+    # New Year's Day on a Saturday is not made up on the Friday before
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))   # Juneteenth
+    return frozenset(days)
+
+
+def is_trading_day(day):
+    return day.weekday() < 5 and day not in holidays(day.year)
+
+
+def follows_sessions(symbol):
+    """False for symbols whose prices move outside exchange sessions"""
+    return not symbol.upper().endswith(ROUND_THE_CLOCK_SUFFIXES)
+
+
+def _now(now):
+    return (now or datetime.now(EXCHANGE_TZ)).astimezone(EXCHANGE_TZ)
+
+
+def is_open(now=None):
+    now = _now(now)
+    return is_trading_day(now.date()) and OPEN <= now.time() < CLOSE
+
+
+def next_open(now=None):
+    """Start of the next regular session after now (now itself if open)"""
+    now = _now(now)
+    day = now.date()
+    if is_trading_day(day) and now.time() < CLOSE:
+        return max(now, datetime.combine(day, OPEN, EXCHANGE_TZ))
+    day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+    return datetime.combine(day, OPEN, EXCHANGE_TZ)
+
+
+def previous_close(now=None):
+    """End of the most recent session that closed before now"""
+    now = _now(now)
+    day = now.date()
+    if not (is_trading_day(day) and now.time() >= CLOSE):
+        day -= timedelta(days=1)
+        while not is_trading_day(day):
+            day -= timedelta(days=1)
+    return datetime.combine(day, CLOSE, EXCHANGE_TZ)
+
+
+def in_session(now=None):
+    """True while the market is open or its close is still settling"""
+    now = _now(now)
+    return is_open(now) or (now - previous_close(now)).total_seconds() < SETTLE_SECONDS
+
+
+def session_ttl(intraday_ttl, now=None):
+    """Seconds a price-derived value stays valid: intraday_ttl during a
+    session (and while the close settles), otherwise until the next open"""
+    now = _now(now)
+    if in_session(now):
+        return intraday_ttl
+    return max(intraday_ttl, (next_open(now) - now).total_seconds())
+
+
+def unchanged_since(timestamp, now=None):
+    """True if prices cannot have moved since epoch time timestamp: the
+    market has stayed closed from a settled close until now"""
+    now = _now(now)
+    if is_open(now):
+        return False
+    return timestamp >= previous_close(now).timestamp() + SETTLE_SECONDS
+
+
+def _quarter_end(day):
+    """Last day of the calendar quarter before the one containing day"""
+    first_month = 3 * ((day.month - 1) // 3) + 1
+    return date(day.year, first_month, 1) - timedelta(days=1)
+
+
+def _add_months(day, months):
+    """day moved by whole months, clamped to the end of shorter months"""
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    last = (date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)).day
+    return date(year, month, min(day.day, last))
+
+
+def fundamentals_ttl(latest_period, now=None, pending_ttl=None):
+    """Seconds quarterly statements stay valid given the end date of the
+    newest reported quarter.
+
+    The next quarter is expected to end three months after latest_period, so
+    fiscal years that don't follow the calendar are tracked too (without a
+    reported quarter, calendar quarters are assumed). Until that quarter has
+    ended nothing can change; after it, its report is due, so check again at
+    the next session (or after pending_ttl, when given) until it appears or
+    its reporting window has passed, then wait for the quarter after it.
+    """
+    now = _now(now)
+    today = now.date()
+    expected = _add_months(latest_period, 3) if latest_period is not None else _quarter_end(today)
+    while today - expected > REPORTING_WINDOW:
+        expected = _add_months(expected, 3)
+
+    until_expected = (datetime.combine(expected + timedelta(days=1), OPEN, EXCHANGE_TZ) - now).total_seconds()
+    if until_expected > 0:
+        return until_expected
+    deadline = (datetime.combine(expected + REPORTING_WINDOW + timedelta(days=1), OPEN, EXCHANGE_TZ)
+                - now).total_seconds()
+    if pending_ttl is not None:
+        wait = pending_ttl
+    else:
+        # The next session's open, not the current one's
+        after = datetime.combine(today, CLOSE, EXCHANGE_TZ) if is_open(now) else now + timedelta(seconds=1)
+        wait = (next_open(after) - now).total_seconds()
+    return max(1.0, min(wait, deadline))
@@ -3,6 +3,9 @@ from datetime import datetime
 from sqlalchemy import Sequence, event
 from sqlalchemy.sql import text
 
+# Virtual cash every new account starts with
+STARTING_BALANCE = 1000000.0
+
 class Company(db.Model):
     __tablename__ = 'companies'
     id = db.Column(db.Integer, primary_key=True)
@@ -13,7 +16,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.LargeBinary, nullable=False)
-    virtual_balance = db.Column(db.Float, default=1000000.0)
+    virtual_balance = db.Column(db.Float, default=STARTING_BALANCE)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class Portfolio(db.Model):
@@ -46,6 +49,12 @@ class Transaction(db.Model):
     price = db.Column(db.Float, nullable=False)
     action = db.Column(db.String(4), nullable=False)  # 'buy' or 'sell'
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        # Keyset pagination of a user's history, newest first
+        db.Index('ix_transaction_user_time', 'user_id', 'timestamp', 'id'),
+        # Per-symbol history and aggregates
+        db.Index('ix_transaction_user_symbol_time', 'user_id', 'symbol', 'timestamp'),
+    )
 
 @event.listens_for(Transaction.__table__, 'after_create')
 def create_transaction_sequence(target, connection, **kw):
@@ -57,4 +66,18 @@ def create_transaction_sequence(target, connection, **kw):
     sequence_name = 'transaction_id_seq'
     connection.execute(text(f'DROP SEQUENCE IF EXISTS {sequence_name}'))
     connection.execute(text(f'CREATE SEQUENCE {sequence_name} START WITH {max_id + 1}'))
-    connection.execute(text(f'ALTER TABLE transaction ALTER COLUMN id SET DEFAULT nextval(\'{sequence_name}\')'))
\ No newline at end of file
+    connection.execute(text(f'ALTER TABLE transaction ALTER COLUMN id SET DEFAULT nextval(\'{sequence_name}\')'))
+
+class PortfolioSnapshot(db.Model):
+    __tablename__ = 'portfolio_snapshot'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    taken_at = db.Column(db.DateTime, nullable=False)
+    cash = db.Column(db.Float, nullable=False)
+    holdings_value = db.Column(db.Float, nullable=False)
+    total_value = db.Column(db.Float, nullable=False)
+    # JSON {symbol: [shares, price]} so the next snapshot can continue from here
+    holdings = db.Column(db.Text, nullable=False, default='{}')
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'taken_at', name='uix_snapshot_user_time'),
+    )
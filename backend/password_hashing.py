@@ -0,0 +1,53 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full and the request should be retried"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated pool so logins can't occupy every
+    request thread.
+
+    At most workers + max_queue hash operations are admitted at once; beyond
+    that callers get HasherBusy immediately instead of queueing. A caller
+    whose hash hasn't finished within timeout also gets HasherBusy, so keep
+    max_queue small enough that the queue drains well inside it.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_queue=6, timeout=10):
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(lambda p: bcrypt.hashpw(p, bcrypt.gensalt(rounds=self.rounds)),
+                         password.encode('utf-8'))
+
+    def check(self, password, hashed):
+        return self._run(bcrypt.checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        """True if hashed was made with a different cost than the current one"""
+        try:
+            return int(hashed.split(b'$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
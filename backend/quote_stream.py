@@ -0,0 +1,124 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HubFull(Exception):
+    """Raised when a subscription would start more pollers than allowed"""
+
+
+class Subscription:
+    """One client's view of the hub: a bounded queue of quote updates"""
+
+    def __init__(self, symbols, max_queued=100):
+        self.symbols = symbols
+        self.queue = queue.Queue(maxsize=max_queued)
+
+    def push(self, event):
+        # Slow clients lose their oldest updates rather than blocking the poller
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def next(self, timeout):
+        """Return the next update, or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class _Poller:
+    def __init__(self):
+        self.subscribers = set()
+        self.stop = threading.Event()
+        self.last_price = None
+        self.thread = None
+
+
+class QuoteHub:
+    """Fans quote updates out to subscribers with one poller per symbol.
+
+    Pollers are reference-counted by their subscribers: the first
+    subscription to a symbol starts its poller and the last unsubscribe stops
+    it. Subscribers only receive an update when the price changes. At most
+    max_pollers symbols are polled at once; a subscription that needs more
+    raises HubFull without starting any.
+    """
+
+    def __init__(self, fetch, interval=5, max_pollers=200):
+        self.fetch = fetch
+        self.interval = interval
+        self.max_pollers = max_pollers
+        self._pollers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbols):
+        symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols))
+        subscription = Subscription(symbols)
+        with self._lock:
+            new = sum(1 for symbol in symbols if symbol not in self._pollers)
+            if len(self._pollers) + new > self.max_pollers:
+                raise HubFull(f"Already polling {len(self._pollers)} symbols")
+            for symbol in symbols:
+                poller = self._pollers.get(symbol)
+                if poller is None:
+                    poller = self._pollers[symbol] = _Poller()
+                    poller.thread = threading.Thread(target=self._poll, args=(symbol, poller),
+                                                     name=f'quote-poller-{symbol}', daemon=True)
+                    poller.thread.start()
+                elif poller.last_price is not None:
+                    subscription.push(self._event(symbol, poller.last_price, None))
+                poller.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for symbol in subscription.symbols:
+                poller = self._pollers.get(symbol)
+                if poller is None:
+                    continue
+                poller.subscribers.discard(subscription)
+                if not poller.subscribers:
+                    poller.stop.set()
+                    del self._pollers[symbol]
+
+    def stats(self):
+        with self._lock:
+            return {symbol: len(poller.subscribers) for symbol, poller in self._pollers.items()}
+
+    @staticmethod
+    def _event(symbol, price, previous):
+        return {
+            'symbol': symbol,
+            'price': price,
+            'change': price - previous if previous is not None else None,
+            'time': int(time.time())
+        }
+
+    def _poll(self, symbol, poller):
+        while not poller.stop.is_set():
+            try:
+                price = float(self.fetch(symbol))
+            except Exception as e:
+                logger.warning("Quote poller error for %s: %s", symbol, e)
+                price = None
+
+            if price is not None and price != poller.last_price:
+                event = self._event(symbol, price, poller.last_price)
+                poller.last_price = price
+                with self._lock:
+                    subscribers = list(poller.subscribers)
+                for subscription in subscribers:
+                    subscription.push(event)
+
+            poller.stop.wait(self.interval)
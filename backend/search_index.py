@@ -0,0 +1,159 @@
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+GRAM_SIZE = 3
+
+logger = logging.getLogger(__name__)
+
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _prefix_range(keys, prefix):
+    """Return the [lo, hi) slice of a sorted key list that starts with prefix"""
+    lo = bisect_left(keys, prefix)
+    hi = bisect_left(keys, prefix + '\uffff')
+    return lo, hi
+
+
+class SearchIndex:
+    """Immutable in-memory index over (symbol, name) pairs.
+
+    Entries are numbered in upper-cased name order, so any posting list
+    sorted by id is already in the order the search results should be
+    returned in, and the upper-cased names can be bisected directly.
+    """
+
+    def __init__(self, companies):
+        entries = sorted(
+            {(symbol, name) for symbol, name in companies if symbol and name},
+            key=lambda entry: (entry[1].upper(), entry[0].upper())
+        )
+        self.entries = entries
+        self.symbols = [symbol.upper() for symbol, _ in entries]
+        self.names = [name.upper() for _, name in entries]
+        self._symbol_set = frozenset(self.symbols)
+
+        # Sorted arrays for prefix lookups
+        symbol_order = sorted(range(len(entries)), key=lambda i: self.symbols[i])
+        self._symbol_keys = [self.symbols[i] for i in symbol_order]
+        self._symbol_ids = symbol_order
+        # Ids are in name order already
+        self._name_keys = self.names
+
+        # Gram postings (1..GRAM_SIZE characters) for substring lookups
+        self._symbol_grams = self._build_grams(self.symbols)
+        self._name_grams = self._build_grams(self.names)
+
+    @staticmethod
+    def _build_grams(texts):
+        postings = {}
+        for i, text in enumerate(texts):
+            grams = set()
+            for n in range(1, GRAM_SIZE + 1):
+                grams |= _grams(text, n)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        return postings
+
+    def __len__(self):
+        return len(self.entries)
+
+    def has_symbol(self, symbol):
+        return symbol.upper() in self._symbol_set
+
+    def _contains(self, postings, texts, query):
+        """Ids whose text contains query, in id (name) order"""
+        if len(query) <= GRAM_SIZE:
+            return postings.get(query, [])
+        candidates = [postings.get(gram) for gram in _grams(query, GRAM_SIZE)]
+        if not all(candidates):
+            return []
+        shortest = min(candidates, key=len)
+        return [i for i in shortest if query in texts[i]]
+
+    def search(self, query, limit=10):
+        """Return up to limit (symbol, name) pairs ranked by relevance tier:
+        symbol prefix, name prefix, symbol contains, name contains.
+        """
+        query = query.strip().upper()
+        if not query:
+            return []
+
+        results = []
+        seen = set()
+
+        def take(ids):
+            for i in ids:
+                if len(results) >= limit:
+                    return
+                if i not in seen:
+                    seen.add(i)
+                    results.append(self.entries[i])
+
+        lo, hi = _prefix_range(self._symbol_keys, query)
+        take(heapq.nsmallest(limit, self._symbol_ids[lo:hi]))
+
+        lo, hi = _prefix_range(self._name_keys, query)
+        take(range(lo, min(hi, lo + 2 * limit)))
+
+        if len(results) < limit:
+            take(self._contains(self._symbol_grams, self.symbols, query))
+        if len(results) < limit:
+            take(self._contains(self._name_grams, self.names, query))
+
+        return results
+
+
+class SearchEngine:
+    """Holds the current SearchIndex and rebuilds it when the source changes.
+
+    loader() returns the (symbol, name) rows; version() returns a cheap
+    fingerprint of the source table that is polled at most every
+    refresh_interval seconds.
+    """
+
+    def __init__(self, loader, version=None, refresh_interval=300):
+        self._loader = loader
+        self._version = version
+        self.refresh_interval = refresh_interval
+        self._index = None
+        self._loaded_version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def reload(self):
+        with self._lock:
+            self._reload_locked()
+        return self._index
+
+    def _reload_locked(self):
+        version = self._version() if self._version else None
+        self._index = SearchIndex(self._loader())
+        self._loaded_version = version
+        self._checked_at = time.monotonic()
+        logger.info("Search index loaded with %d companies", len(self._index))
+
+    def index(self):
+        index = self._index
+        if index is not None and time.monotonic() - self._checked_at < self.refresh_interval:
+            return index
+
+        with self._lock:
+            if self._index is None:
+                self._reload_locked()
+            elif time.monotonic() - self._checked_at >= self.refresh_interval:
+                self._checked_at = time.monotonic()
+                if self._version and self._version() != self._loaded_version:
+                    self._reload_locked()
+            return self._index
+
+    def search(self, query, limit=10):
+        return self.index().search(query, limit)
+
+    def has_symbol(self, symbol):
+        return self.index().has_symbol(symbol)
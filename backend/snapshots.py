@@ -0,0 +1,116 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, or_
+
+from database import db
+from models import STARTING_BALANCE, User, Transaction, PortfolioSnapshot
+
+HISTORY_PERIODS = {
+    '1w': timedelta(days=7),
+    '1mo': timedelta(days=31),
+    '3mo': timedelta(days=92),
+    '6mo': timedelta(days=183),
+    '1y': timedelta(days=366),
+    'max': None,
+}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _latest_times():
+    """(user_id, taken_at) of each user's most recent snapshot, as a subquery"""
+    return (db.session.query(PortfolioSnapshot.user_id,
+                             func.max(PortfolioSnapshot.taken_at).label('taken_at'))
+            .group_by(PortfolioSnapshot.user_id)
+            .subquery())
+
+
+def _latest_snapshots():
+    """Most recent snapshot per user, in one query"""
+    latest = _latest_times()
+    rows = (PortfolioSnapshot.query
+            .join(latest, (PortfolioSnapshot.user_id == latest.c.user_id) &
+                  (PortfolioSnapshot.taken_at == latest.c.taken_at))
+            .all())
+    return {row.user_id: row for row in rows}
+
+
+def take_snapshots(get_stock_prices, taken_at=None):
+    """Record one snapshot per user as of taken_at.
+
+    Each user's holdings and cash continue from their last snapshot plus the
+    transactions since it (or from the starting balance for a first
+    snapshot). All held symbols are priced in a single batched call; a
+    symbol whose price can't be fetched keeps its last snapshot price.
+    Returns the number of snapshots written.
+    """
+    taken_at = taken_at or _utcnow()
+    previous = _latest_snapshots()
+    user_ids = [user_id for (user_id,) in db.session.query(User.id).all()]
+    if not user_ids:
+        return 0
+
+    # Only each user's transactions after their own last snapshot (all of
+    # them for users without one)
+    latest = _latest_times()
+    transactions = (Transaction.query
+                    .outerjoin(latest, Transaction.user_id == latest.c.user_id)
+                    .filter(Transaction.timestamp <= taken_at,
+                            or_(latest.c.taken_at.is_(None), Transaction.timestamp > latest.c.taken_at)))
+    by_user = {}
+    for transaction in transactions.order_by(Transaction.timestamp, Transaction.id):
+        by_user.setdefault(transaction.user_id, []).append(transaction)
+
+    states = {}
+    for user_id in user_ids:
+        snapshot = previous.get(user_id)
+        if snapshot is not None and snapshot.taken_at >= taken_at:
+            continue
+        cash = snapshot.cash if snapshot else STARTING_BALANCE
+        holdings = json.loads(snapshot.holdings) if snapshot else {}
+        for transaction in by_user.get(user_id, []):
+            shares, price = holdings.get(transaction.symbol, [0, transaction.price])
+            if transaction.action == 'buy':
+                cash -= transaction.shares * transaction.price
+                shares += transaction.shares
+            else:
+                cash += transaction.shares * transaction.price
+                shares -= transaction.shares
+            if shares > 0:
+                holdings[transaction.symbol] = [shares, price]
+            else:
+                holdings.pop(transaction.symbol, None)
+        states[user_id] = (cash, holdings)
+
+    symbols = {symbol for _, holdings in states.values() for symbol in holdings}
+    prices = get_stock_prices(list(symbols)) if symbols else {}
+
+    for user_id, (cash, holdings) in states.items():
+        holdings_value = 0.0
+        for symbol, position in holdings.items():
+            price = prices.get(symbol)
+            if not isinstance(price, Exception) and price is not None:
+                position[1] = float(price)
+            holdings_value += position[0] * position[1]
+        db.session.add(PortfolioSnapshot(
+            user_id=user_id,
+            taken_at=taken_at,
+            cash=cash,
+            holdings_value=holdings_value,
+            total_value=cash + holdings_value,
+            holdings=json.dumps(holdings)
+        ))
+    db.session.commit()
+    return len(states)
+
+
+def snapshot_history(user_id, period):
+    """Snapshots for one user within period, oldest first"""
+    query = PortfolioSnapshot.query.filter_by(user_id=user_id)
+    span = HISTORY_PERIODS[period]
+    if span is not None:
+        query = query.filter(PortfolioSnapshot.taken_at >= _utcnow() - span)
+    return query.order_by(PortfolioSnapshot.taken_at).all()
@@ -0,0 +1,79 @@
+"""Report how long a service takes to import, broken down by module.
+
+Runs `python -X importtime -c "import app"` in a fresh interpreter and
+lists the modules with the largest cumulative import time, so cold-start
+regressions show up before deploy.
+
+    python startup_report.py                        # this service
+    python startup_report.py --app-dir ../backend-datahandle --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+def measure(app_dir, module):
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URI', 'sqlite:////tmp/startup-report.db')
+    env.setdefault('JWT_SECRET_KEY', 'startup-report')
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=app_dir, env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # "import time:  <self us> | <cumulative us> | <indented module name>"
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        timings.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return wall, timings
+
+
+def direct_imports(timings, module):
+    """Modules imported directly by module (children are listed before their
+    parent in -X importtime output, indented two spaces deeper)"""
+    for position in range(len(timings) - 1, -1, -1):
+        name = timings[position][2]
+        if name.strip() == module:
+            break
+    else:
+        return []
+    depth = len(name) - len(name.lstrip())
+    children = []
+    for timing in reversed(timings[:position]):
+        child_depth = len(timing[2]) - len(timing[2].lstrip())
+        if child_depth <= depth:
+            break
+        if child_depth == depth + 2:
+            children.append(timing)
+    return children
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import-time breakdown for a Flask service')
+    parser.add_argument('--app-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args()
+
+    wall, timings = measure(args.app_dir, args.module)
+    breakdown = direct_imports(timings, args.module)
+    breakdown.sort(reverse=True)
+    total_us = next((t[0] for t in timings if t[2].strip() == args.module), 0)
+
+    print(f"Startup of {args.module} in {args.app_dir}: {wall * 1000:.0f} ms wall, "
+          f"{total_us / 1000:.0f} ms importing {args.module}")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, name in breakdown[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name.strip()}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import db  # noqa: E402
+import models  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A bare Flask app bound to TEST_DATABASE_URI (use Postgres to exercise
+    row locks), or to a throwaway SQLite file"""
+    uri = os.getenv('TEST_DATABASE_URI') or f"sqlite:///{tmp_path / 'test.db'}"
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    if uri.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+        # The id sequences are Postgres-only
+        for table, listener in ((models.Portfolio.__table__, models.create_portfolio_sequence),
+                                (models.Transaction.__table__, models.create_transaction_sequence)):
+            if event.contains(table, 'after_create', listener):
+                event.remove(table, 'after_create', listener)
+    db.init_app(app)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
@@ -0,0 +1,101 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bar_store as bars
+
+NOW = pd.Timestamp.now(tz='America/New_York').floor('min')
+
+
+def _frame(index):
+    close = np.linspace(100, 110, len(index))
+    return pd.DataFrame({'Open': close, 'High': close + 1, 'Low': close - 1,
+                         'Close': close, 'Volume': 1e6}, index=index)
+
+
+class FakeTicker:
+    """yfinance Ticker stand-in serving a fixed frame and recording calls"""
+    frame = None
+    lookback = None
+    calls = []
+
+    def __init__(self, symbol):
+        pass
+
+    def history(self, period=None, interval=None, start=None):
+        FakeTicker.calls.append({'period': period, 'start': start})
+        frame = FakeTicker.frame
+        if FakeTicker.lookback is not None:
+            # Like yfinance, nothing at all for a start it no longer serves
+            if start is not None and start < NOW - FakeTicker.lookback:
+                return frame.iloc[:0]
+            frame = frame[frame.index >= NOW - FakeTicker.lookback]
+        if start is not None:
+            return frame[frame.index >= start]
+        return frame
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(bars.yf, 'Ticker', FakeTicker)
+    FakeTicker.calls = []
+    FakeTicker.lookback = None
+    return bars.BarStore(str(tmp_path))
+
+
+def _age(store, seconds):
+    for series in store._loaded.values():
+        series.fetched_at -= seconds
+
+
+def test_period_days():
+    assert bars.period_days('ytd') == 366
+    assert bars.period_days('60d') == 60
+    assert bars.period_days('3y') == 3 * 366
+    with pytest.raises(ValueError):
+        bars.period_days('yt')
+
+
+def test_ytd_starts_at_new_year(store):
+    FakeTicker.frame = _frame(pd.date_range(end=NOW.normalize(), periods=600, freq='B'))
+    hist = store.history('AAPL', period='ytd', interval='1d')
+    assert hist.index[0] >= NOW.normalize().replace(month=1, day=1)
+    assert hist.index[-1] == FakeTicker.frame.index[-1]
+
+
+def test_counted_days_outgrow_stored_period(store):
+    FakeTicker.frame = _frame(pd.date_range(end=NOW.normalize(), periods=200, freq='B'))
+    store.history('AAPL', period='5d', interval='1d')
+    hist = store.history('AAPL', period='60d', interval='1d')
+    assert [call['period'] for call in FakeTicker.calls] == ['5d', '60d']
+    assert len(hist) == 60
+
+
+def test_gap_past_lookback_refetches_in_full(store):
+    old = pd.date_range(end=NOW - pd.Timedelta(days=90), periods=100, freq='5min')
+    FakeTicker.frame = _frame(old)
+    store.history('AAPL', period='1d', interval='5m')
+
+    FakeTicker.frame = _frame(pd.date_range(end=NOW, periods=100, freq='5min'))
+    FakeTicker.lookback = pd.Timedelta(days=60)
+    _age(store, 90 * 86400)
+    FakeTicker.calls = []
+    hist = store.history('AAPL', period='1d', interval='5m')
+    assert FakeTicker.calls == [{'period': '1d', 'start': None}]
+    assert hist.index[-1] == FakeTicker.frame.index[-1]
+
+
+def test_empty_tail_on_stale_series_refetches_in_full(store):
+    FakeTicker.frame = _frame(pd.date_range(end=NOW.normalize() - pd.Timedelta(days=20), periods=50, freq='B'))
+    store.history('AAPL', period='1mo', interval='1d')
+
+    # The provider's frame moved on, but it returns nothing from the stored tail
+    FakeTicker.frame = _frame(pd.date_range(end=NOW.normalize(), periods=50, freq='B'))
+    FakeTicker.lookback = pd.Timedelta(days=5)
+    _age(store, 30 * 86400)
+    FakeTicker.calls = []
+    hist = store.history('AAPL', period='1mo', interval='1d')
+    assert [call['period'] for call in FakeTicker.calls] == [None, '1mo']
+    assert hist.index[-1] == FakeTicker.frame.index[-1]
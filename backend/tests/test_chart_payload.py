@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from chart_payload import downsample_indices
+
+
+@pytest.mark.parametrize('width', [1, 4, 21])
+@pytest.mark.parametrize('points', [10, 50, 200])
+def test_downsample_respects_budget(width, points):
+    values = np.random.default_rng(0).normal(size=(1000, width)).cumsum(axis=0)
+    rows = downsample_indices(values, points)
+    assert len(rows) <= points
+    assert rows[0] == 0 and rows[-1] == 999
+    assert np.all(np.diff(rows) > 0)
+
+
+def test_downsample_keeps_extremes():
+    values = np.random.default_rng(1).normal(size=(1000, 2)).cumsum(axis=0)
+    rows = downsample_indices(values, 100)
+    for column in values.T:
+        assert column.argmin() in rows and column.argmax() in rows
+
+
+def test_short_series_is_untouched():
+    assert downsample_indices(np.arange(5.0), 10).tolist() == [0, 1, 2, 3, 4]
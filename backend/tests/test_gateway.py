@@ -0,0 +1,123 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from gateway import CircuitOpenError, GatewayClient
+
+
+class StubService:
+    """Local JSON service whose status, ETag and latency tests can change"""
+
+    def __init__(self):
+        self.status = 200
+        self.etag = None
+        self.delay = 0.0
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append({'path': self.path, 'if_none_match': self.headers.get('If-None-Match')})
+                    count = len(stub.requests)
+                time.sleep(stub.delay)
+                if stub.etag and self.headers.get('If-None-Match') == stub.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = json.dumps({'path': self.path, 'count': count}).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if stub.etag:
+                    self.send_header('ETag', stub.etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    service = StubService()
+    yield service
+    service.close()
+
+
+def test_concurrent_gets_are_coalesced(stub):
+    stub.delay = 0.3
+    client = GatewayClient(stub.url, cache_ttl=0)
+    start = threading.Barrier(8)
+    results = []
+
+    def call():
+        start.wait()
+        results.append(client.get('/api/quote', {'symbol': 'AAPL'}))
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(stub.requests) == 1
+    assert len(results) == 8 and all(result == results[0] for result in results)
+    assert client.stats()['coalesced'] == 7
+
+
+def test_expired_entry_is_revalidated_with_etag(stub):
+    stub.etag = '"v1"'
+    client = GatewayClient(stub.url, cache_ttl=0.1)
+
+    first = client.get('/api/data')
+    assert client.get('/api/data') == first
+    assert len(stub.requests) == 1
+
+    time.sleep(0.15)
+    assert client.get('/api/data') == first
+    assert stub.requests[-1]['if_none_match'] == '"v1"'
+    assert client.stats()['revalidated'] == 1
+
+    # A changed resource is fetched in full and replaces the entry
+    stub.etag = '"v2"'
+    time.sleep(0.15)
+    data, status = client.get('/api/data')
+    assert status == 200 and data['count'] == 3
+
+
+def test_breaker_opens_half_opens_and_closes(stub):
+    stub.status = 500
+    client = GatewayClient(stub.url, cache_ttl=0, failure_threshold=2, reset_timeout=0.2)
+
+    for _ in range(2):
+        assert client.get('/api/data')[1] == 500
+    assert client.circuit_state() == 'open'
+    with pytest.raises(CircuitOpenError):
+        client.get('/api/data')
+    assert len(stub.requests) == 2
+
+    # A failed trial reopens the circuit
+    time.sleep(0.25)
+    assert client.circuit_state() == 'half-open'
+    assert client.get('/api/data')[1] == 500
+    assert client.circuit_state() == 'open'
+
+    # A successful trial closes it
+    stub.status = 200
+    time.sleep(0.25)
+    assert client.get('/api/data')[1] == 200
+    assert client.circuit_state() == 'closed'
+    assert len(stub.requests) == 4
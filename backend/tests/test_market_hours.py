@@ -0,0 +1,36 @@
+from datetime import date, datetime
+
+import market_hours
+from market_hours import EXCHANGE_TZ, fundamentals_ttl
+
+DAY = 86400
+
+
+def _at(*args):
+    return datetime(*args, tzinfo=EXCHANGE_TZ)
+
+
+def test_fiscal_quarter_report_is_polled_until_it_appears():
+    # Quarters ending late January / April (NVDA-like) and January / April /
+    # July / October (Walmart-like) are due before the calendar ones
+    assert fundamentals_ttl(date(2026, 1, 25), _at(2026, 5, 20, 10)) < DAY
+    assert fundamentals_ttl(date(2025, 10, 31), _at(2026, 2, 17, 10)) < DAY
+
+
+def test_nothing_changes_before_the_next_quarter_ends():
+    ttl = fundamentals_ttl(date(2026, 3, 31), _at(2026, 4, 10, 10))
+    assert ttl == (_at(2026, 7, 1, 9, 30) - _at(2026, 4, 10, 10)).total_seconds()
+
+
+def test_missed_report_waits_for_the_following_quarter():
+    # The quarter ending 2026-03-31 was never reported; the next one is due
+    # once it ends on 2026-06-30
+    assert fundamentals_ttl(date(2025, 12, 31), _at(2026, 6, 10, 10)) == \
+        (_at(2026, 7, 1, 9, 30) - _at(2026, 6, 10, 10)).total_seconds()
+
+
+def test_pending_report_is_checked_at_the_next_session():
+    now = _at(2026, 4, 10, 10)  # a Friday session
+    assert fundamentals_ttl(date(2025, 12, 31), now) == (_at(2026, 4, 13, 9, 30) - now).total_seconds()
+    assert fundamentals_ttl(date(2025, 12, 31), now, pending_ttl=600) == 600
+    assert market_hours.is_open(now)
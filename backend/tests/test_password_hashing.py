@@ -0,0 +1,31 @@
+import threading
+
+import pytest
+
+from password_hashing import HasherBusy, PasswordHasher
+
+
+def test_full_queue_is_busy():
+    hasher = PasswordHasher(rounds=4, workers=1, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+    blocker = threading.Thread(target=lambda: hasher._run(lambda: started.set() or release.wait()))
+    blocker.start()
+    started.wait()
+    try:
+        with pytest.raises(HasherBusy):
+            hasher.hash('secret')
+    finally:
+        release.set()
+        blocker.join()
+
+
+def test_slow_hash_is_busy_not_timeout():
+    hasher = PasswordHasher(rounds=4, workers=1, max_queue=1, timeout=0.05)
+    release = threading.Event()
+    try:
+        with pytest.raises(HasherBusy):
+            hasher._run(release.wait)
+    finally:
+        release.set()
+    # The slot is returned once the hash finishes
+    assert hasher.check('secret', hasher.hash('secret'))
@@ -0,0 +1,37 @@
+from search_index import SearchIndex
+
+COMPANIES = [
+    ('BAC', 'Bank of America Corporation'),
+    ('EHTH', 'eHealth, Inc.'),
+    ('IBM', 'International Business Machines Corporation'),
+    ('IRBT', 'iRobot Corporation'),
+    ('ZM', 'Zoom Video Communications, Inc.'),
+    ('AAPL', 'Apple Inc.'),
+]
+
+
+def symbols(results):
+    return [symbol for symbol, _ in results]
+
+
+def test_name_prefix_ignores_case():
+    index = SearchIndex(COMPANIES)
+    assert symbols(index.search('Z')) == ['ZM']
+    assert symbols(index.search('Zoo')) == ['ZM']
+    assert symbols(index.search('ir')) == ['IRBT']
+    assert symbols(index.search('eheal')) == ['EHTH']
+
+
+def test_tiers_are_ranked():
+    index = SearchIndex(COMPANIES)
+    # Symbol prefix, then name prefix, then symbol and name substrings
+    assert symbols(index.search('I')) == ['IBM', 'IRBT', 'AAPL', 'BAC', 'EHTH', 'ZM']
+
+
+def test_every_name_prefix_result_matches():
+    index = SearchIndex(COMPANIES)
+    for _, name in COMPANIES:
+        for end in range(1, len(name) + 1):
+            prefix = name[:end]
+            for symbol, match in index.search(prefix):
+                assert symbol.startswith(prefix.upper()) or prefix.upper() in match.upper()
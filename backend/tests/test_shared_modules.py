@@ -0,0 +1,16 @@
+import importlib.util
+import os
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _sync_shared():
+    spec = importlib.util.spec_from_file_location('sync_shared', os.path.join(ROOT, 'scripts', 'sync_shared.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_service_copies_match():
+    # Edit backend/<module> and run scripts/sync_shared.py to update the copies
+    assert _sync_shared().differing() == []
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import db
+from models import PortfolioSnapshot, Transaction, User
+from snapshots import STARTING_BALANCE, take_snapshots
+
+START = datetime(2026, 1, 5, 12, 0)
+
+
+def _user(email):
+    user = User(email=email, password=b'x', virtual_balance=STARTING_BALANCE)
+    db.session.add(user)
+    db.session.flush()
+    return user.id
+
+
+def _trade(user_id, action, shares, price, at):
+    db.session.add(Transaction(user_id=user_id, symbol='AAPL', action=action,
+                               shares=shares, price=price, timestamp=at))
+
+
+def _prices(symbols):
+    return {symbol: 20.0 for symbol in symbols}
+
+
+def _latest(user_id):
+    return (PortfolioSnapshot.query.filter_by(user_id=user_id)
+            .order_by(PortfolioSnapshot.taken_at.desc()).first())
+
+
+def test_new_user_does_not_replay_existing_users_history(app):
+    old = _user('old@example.com')
+    _trade(old, 'buy', 10, 10.0, START)
+    db.session.commit()
+    take_snapshots(_prices, taken_at=START + timedelta(hours=1))
+
+    new = _user('new@example.com')
+    _trade(old, 'sell', 4, 15.0, START + timedelta(hours=2))
+    _trade(new, 'buy', 5, 10.0, START + timedelta(hours=2))
+    db.session.commit()
+    assert take_snapshots(_prices, taken_at=START + timedelta(hours=3)) == 2
+
+    old_snapshot = _latest(old)
+    assert old_snapshot.cash == pytest.approx(STARTING_BALANCE - 100.0 + 60.0)
+    assert old_snapshot.holdings_value == pytest.approx(6 * 20.0)
+    new_snapshot = _latest(new)
+    assert new_snapshot.cash == pytest.approx(STARTING_BALANCE - 50.0)
+    assert new_snapshot.holdings_value == pytest.approx(5 * 20.0)
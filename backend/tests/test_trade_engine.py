@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from database import db
+from models import Portfolio, Transaction, User
+from trade_engine import TradeError, apply_order
+
+PRICE = 10.0
+
+
+def _account(balance, shares):
+    user = User(email='trader@example.com', password=b'x', virtual_balance=balance)
+    db.session.add(user)
+    db.session.flush()
+    if shares:
+        db.session.add(Portfolio(user_id=user.id, symbol='AAPL', shares=shares, average_price=PRICE))
+    db.session.commit()
+    return user.id
+
+
+def _run_concurrently(app, user_id, batches, rounds=10):
+    """Run each batch of orders `rounds` times from its own thread, one
+    transaction per batch; returns the outcome counts and unexpected errors"""
+    counts = {'committed': 0, 'rejected': 0}
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(len(batches))
+
+    def worker(orders):
+        with app.app_context():
+            start.wait()
+            for _ in range(rounds):
+                try:
+                    for symbol, action, shares in orders:
+                        apply_order(user_id, symbol, action, shares, PRICE)
+                    db.session.commit()
+                    result = 'committed'
+                except TradeError:
+                    db.session.rollback()
+                    result = 'rejected'
+                except Exception as e:
+                    db.session.rollback()
+                    with lock:
+                        errors.append(e)
+                    continue
+                with lock:
+                    counts[result] += 1
+            db.session.remove()
+
+    threads = [threading.Thread(target=worker, args=(orders,)) for orders in batches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=120)
+    assert not any(thread.is_alive() for thread in threads)
+    return counts, errors
+
+
+def _position(user_id):
+    db.session.expire_all()
+    item = Portfolio.query.filter_by(user_id=user_id, symbol='AAPL').first()
+    return item.shares if item else 0
+
+
+def _balance(user_id):
+    db.session.expire_all()
+    return db.session.get(User, user_id).virtual_balance
+
+
+def test_concurrent_buys_and_sells_do_not_deadlock(app):
+    user_id = _account(balance=1000.0, shares=50)
+    batches = [
+        [('AAPL', 'buy', 1)],
+        [('AAPL', 'sell', 1)],
+        [('AAPL', 'buy', 2), ('AAPL', 'sell', 1)],
+        [('AAPL', 'sell', 2), ('AAPL', 'buy', 1)],
+    ]
+    counts, errors = _run_concurrently(app, user_id, batches)
+
+    assert errors == []
+    assert counts['committed'] == 40
+    # Net zero shares per round: the account ends where it started
+    assert _position(user_id) == 50
+    assert _balance(user_id) == pytest.approx(1000.0)
+    assert Transaction.query.filter_by(user_id=user_id).count() == 60
+
+
+def test_concurrent_sells_never_oversell(app):
+    user_id = _account(balance=0.0, shares=15)
+    counts, errors = _run_concurrently(app, user_id, [[('AAPL', 'sell', 1)]] * 4)
+
+    assert errors == []
+    assert counts == {'committed': 15, 'rejected': 25}
+    assert _position(user_id) == 0
+    assert _balance(user_id) == pytest.approx(15 * PRICE)
+
+
+def test_concurrent_buys_never_overdraw(app):
+    user_id = _account(balance=25 * PRICE, shares=0)
+    counts, errors = _run_concurrently(app, user_id, [[('AAPL', 'buy', 1)]] * 4)
+
+    assert errors == []
+    assert counts == {'committed': 25, 'rejected': 15}
+    assert _balance(user_id) == pytest.approx(0.0)
+    assert _position(user_id) == 25
+
+
+def test_failed_sell_in_batch_rolls_back_its_credit(app):
+    user_id = _account(balance=100.0, shares=5)
+    with pytest.raises(TradeError):
+        apply_order(user_id, 'AAPL', 'sell', 6, PRICE)
+    db.session.rollback()
+
+    assert _balance(user_id) == pytest.approx(100.0)
+    assert _position(user_id) == 5
@@ -0,0 +1,130 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import update, delete
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import User, Portfolio, Transaction
+
+
+class TradeError(Exception):
+    """A rejected order; carries the HTTP status and extra response fields"""
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details
+
+    def to_dict(self):
+        return {'error': self.message, **self.details}
+
+
+def parse_order(data):
+    """Validate one order payload and return (symbol, action, shares)"""
+    if not data:
+        raise TradeError('No data provided')
+    if 'symbol' not in data or 'action' not in data or 'shares' not in data:
+        raise TradeError('Missing required fields')
+    if data['action'] not in ('buy', 'sell'):
+        raise TradeError('Action must be buy or sell')
+    try:
+        shares = int(data['shares'])
+    except (TypeError, ValueError):
+        raise TradeError('Invalid number of shares')
+    if shares <= 0:
+        raise TradeError('Number of shares must be positive')
+    return data['symbol'], data['action'], shares
+
+
+def _buy(user_id, symbol, shares, price):
+    total_cost = price * shares
+
+    # Debit only if the balance still covers the cost at write time
+    result = db.session.execute(
+        update(User)
+        .where(User.id == user_id, User.virtual_balance >= total_cost)
+        .values(virtual_balance=User.virtual_balance - total_cost)
+    )
+    if result.rowcount == 0:
+        available = db.session.query(User.virtual_balance).filter_by(id=user_id).scalar()
+        raise TradeError('Insufficient funds', required=total_cost, available=available)
+
+    portfolio_item = Portfolio.query.filter_by(
+        user_id=user_id, symbol=symbol).with_for_update().first()
+    if portfolio_item:
+        new_shares = portfolio_item.shares + shares
+        portfolio_item.average_price = ((portfolio_item.shares * portfolio_item.average_price) +
+                                        (shares * price)) / new_shares
+        portfolio_item.shares = new_shares
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(Portfolio(user_id=user_id, symbol=symbol,
+                                     shares=shares, average_price=price))
+    except IntegrityError:
+        # A concurrent order created the position first; add to it instead
+        portfolio_item = Portfolio.query.filter_by(
+            user_id=user_id, symbol=symbol).with_for_update().one()
+        new_shares = portfolio_item.shares + shares
+        portfolio_item.average_price = ((portfolio_item.shares * portfolio_item.average_price) +
+                                        (shares * price)) / new_shares
+        portfolio_item.shares = new_shares
+
+
+def _sell(user_id, symbol, shares, price):
+    # Credit first so the user row is locked before the position row, the
+    # same order as _buy; a failed share check below is rolled back by the
+    # caller along with the credit
+    db.session.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(virtual_balance=User.virtual_balance + price * shares)
+    )
+
+    # Remove shares only if the position still holds enough of them
+    result = db.session.execute(
+        update(Portfolio)
+        .where(Portfolio.user_id == user_id, Portfolio.symbol == symbol,
+               Portfolio.shares >= shares)
+        .values(shares=Portfolio.shares - shares)
+    )
+    if result.rowcount == 0:
+        owned = db.session.query(Portfolio.id).filter_by(user_id=user_id, symbol=symbol).first()
+        if not owned:
+            raise TradeError('You do not own this stock')
+        raise TradeError('Not enough shares to sell')
+
+    db.session.execute(
+        delete(Portfolio).where(Portfolio.user_id == user_id, Portfolio.symbol == symbol,
+                                Portfolio.shares == 0)
+    )
+
+
+def apply_order(user_id, symbol, action, shares, price):
+    """Apply one priced order inside the caller's transaction.
+
+    Every order locks the account's user row before any of its portfolio
+    rows, so concurrent orders and batches on one account queue behind each
+    other instead of deadlocking. The caller commits or rolls back; a
+    TradeError leaves the session in a state that must be rolled back.
+    """
+    if action == 'buy':
+        _buy(user_id, symbol, shares, price)
+    else:
+        _sell(user_id, symbol, shares, price)
+
+    transaction = Transaction(
+        user_id=user_id,
+        symbol=symbol,
+        shares=shares,
+        price=price,
+        action=action,
+        timestamp=datetime.now(timezone.utc)
+    )
+    db.session.add(transaction)
+    return transaction
+
+
+def current_balance(user_id):
+    return db.session.query(User.virtual_balance).filter_by(id=user_id).scalar()
@@ -0,0 +1,110 @@
+import base64
+from datetime import datetime
+
+from sqlalchemy import and_, or_, case, func
+
+from database import db
+from models import Transaction
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class HistoryQueryError(ValueError):
+    """Invalid filter or cursor in a history request"""
+
+
+def encode_cursor(transaction):
+    raw = f"{transaction.timestamp.isoformat()}|{transaction.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        timestamp, transaction_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(timestamp), int(transaction_id)
+    except Exception:
+        raise HistoryQueryError('Invalid cursor')
+
+
+def _parse_date(value, name):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HistoryQueryError(f'Invalid {name} date, expected ISO format (YYYY-MM-DD)')
+
+
+def filtered_query(user_id, symbol=None, action=None, start=None, end=None):
+    query = Transaction.query.filter(Transaction.user_id == user_id)
+    if symbol:
+        query = query.filter(Transaction.symbol == symbol)
+    if action:
+        if action not in ('buy', 'sell'):
+            raise HistoryQueryError('Action must be buy or sell')
+        query = query.filter(Transaction.action == action)
+    if start:
+        query = query.filter(Transaction.timestamp >= _parse_date(start, 'start'))
+    if end:
+        query = query.filter(Transaction.timestamp < _parse_date(end, 'end'))
+    return query
+
+
+def transaction_page(query, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of transactions, newest first, plus the cursor for the next"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        timestamp, transaction_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Transaction.timestamp < timestamp,
+            and_(Transaction.timestamp == timestamp, Transaction.id < transaction_id)
+        ))
+    rows = query.order_by(Transaction.timestamp.desc(), Transaction.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def symbol_aggregates(user_id, symbol=None):
+    """Per-symbol totals and realized P&L (average cost method) for a user"""
+    totals = db.session.query(
+        Transaction.symbol,
+        func.count(Transaction.id),
+        func.sum(case((Transaction.action == 'buy', Transaction.shares), else_=0)),
+        func.sum(case((Transaction.action == 'buy', Transaction.shares * Transaction.price), else_=0)),
+        func.sum(case((Transaction.action == 'sell', Transaction.shares), else_=0)),
+        func.sum(case((Transaction.action == 'sell', Transaction.shares * Transaction.price), else_=0)),
+    ).filter(Transaction.user_id == user_id)
+    if symbol:
+        totals = totals.filter(Transaction.symbol == symbol)
+
+    aggregates = {}
+    for sym, count, buy_shares, buy_amount, sell_shares, sell_amount in totals.group_by(Transaction.symbol):
+        aggregates[sym] = {
+            'trades': count,
+            'buy_shares': int(buy_shares or 0),
+            'buy_amount': float(buy_amount or 0),
+            'sell_shares': int(sell_shares or 0),
+            'sell_amount': float(sell_amount or 0),
+            'realized_pnl': 0.0,
+        }
+
+    # Realized P&L needs the running average cost, so replay the trades in order
+    replay = db.session.query(
+        Transaction.symbol, Transaction.action, Transaction.shares, Transaction.price
+    ).filter(Transaction.user_id == user_id)
+    if symbol:
+        replay = replay.filter(Transaction.symbol == symbol)
+    positions = {}
+    for sym, action, shares, price in replay.order_by(Transaction.timestamp, Transaction.id).yield_per(1000):
+        held, average = positions.get(sym, (0, 0.0))
+        if action == 'buy':
+            average = (held * average + shares * price) / (held + shares)
+            held += shares
+        else:
+            aggregates[sym]['realized_pnl'] += (price - average) * shares
+            held -= shares
+        positions[sym] = (held, average)
+
+    for values in aggregates.values():
+        values['realized_pnl'] = round(values['realized_pnl'], 2)
+    return aggregates
@@ -0,0 +1,230 @@
+"""Central scheduler for yfinance calls.
+
+Every upstream call goes through scheduler.call(), which:
+
+- draws from a token bucket (UPSTREAM_RATE calls/s, bursts of UPSTREAM_BURST);
+  interactive calls can also draw from a reserve of UPSTREAM_INTERACTIVE_BURST
+  tokens refilled at UPSTREAM_INTERACTIVE_RATE calls/s, so pricing a whole
+  portfolio on a cold cache is not held to the background rate
+- runs at most UPSTREAM_CONCURRENCY calls at once
+- hands free slots to waiting callers by priority class, then arrival order
+- retries rate-limit and network errors with full-jitter exponential backoff;
+  a rate-limit error also pauses the whole bucket for the backoff delay
+- gives up with UpstreamBusy once a caller has waited UPSTREAM_MAX_WAIT
+  seconds for a slot
+
+The limits are per process. Code that runs as background work (cache
+refreshes, forecast training, quote polling) wraps itself in
+priority(BACKGROUND) so interactive requests are served first. Thread pools
+do not inherit the priority automatically; submit work with submit() to keep
+the caller's class.
+
+Set UPSTREAM_FAKE=1 to replace yfinance with the deterministic fake in
+fake_upstream.py, e.g. for tests and load runs that must not touch Yahoo.
+"""
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from lazy import lazy_import
+from metrics import registry, yfinance_call
+
+if os.getenv('UPSTREAM_FAKE') == '1':
+    yf = lazy_import('fake_upstream')
+else:
+    yf = lazy_import('yfinance')
+
+# Priority classes, most urgent first
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', NORMAL: 'normal', BACKGROUND: 'background'}
+
+_priority = contextvars.ContextVar('upstream_priority', default=NORMAL)
+
+retries = registry.counter(
+    'upstream_retries_total', 'yfinance calls retried after a transient error',
+    labels=('method',))
+
+rejected = registry.counter(
+    'upstream_rejected_total', 'yfinance calls refused because no slot freed up in time',
+    labels=('priority',))
+
+
+class UpstreamBusy(Exception):
+    """Raised when a call could not be scheduled within the wait limit"""
+
+
+def set_priority(level):
+    """Set the current context's priority; returns a token for reset_priority()"""
+    return _priority.set(level)
+
+
+def reset_priority(token):
+    _priority.reset(token)
+
+
+@contextmanager
+def priority(level):
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def submit(executor, func, *args, **kwargs):
+    """executor.submit() that runs func with the caller's priority"""
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+def is_rate_limit(error):
+    return 'RateLimit' in type(error).__name__ or 'Too Many Requests' in str(error)
+
+
+def is_retryable(error):
+    # yfinance's HTTP client errors are OSError subclasses
+    return is_rate_limit(error) or isinstance(error, (OSError, TimeoutError))
+
+
+class UpstreamScheduler:
+    def __init__(self, rate=4.0, burst=10, max_concurrent=6, max_retries=3,
+                 base_delay=0.5, max_delay=8.0, max_wait=10.0,
+                 interactive_rate=2.0, interactive_burst=40):
+        self.rate = rate
+        self.burst = burst
+        self.interactive_rate = interactive_rate
+        self.interactive_burst = interactive_burst
+        self.max_concurrent = max_concurrent
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+
+        self._tokens = float(burst)
+        self._reserve = float(interactive_burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._active = 0
+        self._waiting = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        elapsed = now - self._refilled_at
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+        self._reserve = min(self.interactive_burst, self._reserve + elapsed * self.interactive_rate)
+        self._refilled_at = now
+
+    def _take(self, level, now):
+        """Spend a token for level and return 0, or return the seconds until one is free"""
+        paused = self._paused_until - now
+        if paused > 0:
+            return paused
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        if level == INTERACTIVE and self._reserve >= 1:
+            self._reserve -= 1
+            return 0
+        wait = (1 - self._tokens) / self.rate
+        if level == INTERACTIVE and self.interactive_rate > 0:
+            wait = min(wait, (1 - self._reserve) / self.interactive_rate)
+        return wait
+
+    def _acquire(self, level):
+        deadline = time.monotonic() + self.max_wait
+        ticket = (level, next(self._sequence))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    delay = None
+                    if self._waiting[0] == ticket and self._active < self.max_concurrent:
+                        self._refill(now)
+                        delay = self._take(level, now)
+                        if delay == 0:
+                            self._active += 1
+                            heapq.heappop(self._waiting)
+                            self._cond.notify_all()
+                            return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise UpstreamBusy(f"No upstream slot within {self.max_wait}s")
+                    self._cond.wait(min(delay, remaining) if delay is not None else remaining)
+            except BaseException:
+                if ticket in self._waiting:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    self._cond.notify_all()
+                raise
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _pause(self, delay):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+    def call(self, method, func, *args, **kwargs):
+        """Run func(*args, **kwargs) as one scheduled yfinance call.
+
+        method names the call for metrics ('history', 'info', ...).
+        """
+        level = _priority.get()
+        attempt = 0
+        while True:
+            try:
+                self._acquire(level)
+            except UpstreamBusy:
+                rejected.inc(priority=PRIORITY_NAMES[level])
+                raise
+            try:
+                with yfinance_call(method):
+                    return func(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if is_rate_limit(e):
+                    self._pause(delay)
+            finally:
+                self._release()
+            attempt += 1
+            retries.inc(method=method)
+            time.sleep(delay)
+
+    def stats(self):
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                'active': self._active,
+                'waiting': len(self._waiting),
+                'tokens': self._tokens,
+                'interactive_tokens': self._reserve,
+                'paused_for': max(0.0, self._paused_until - time.monotonic()),
+            }
+
+
+scheduler = UpstreamScheduler(
+    rate=float(os.getenv('UPSTREAM_RATE', '4')),
+    burst=int(os.getenv('UPSTREAM_BURST', '10')),
+    max_concurrent=int(os.getenv('UPSTREAM_CONCURRENCY', '6')),
+    max_retries=int(os.getenv('UPSTREAM_MAX_RETRIES', '3')),
+    max_wait=float(os.getenv('UPSTREAM_MAX_WAIT', '10')),
+    interactive_rate=float(os.getenv('UPSTREAM_INTERACTIVE_RATE', '2')),
+    interactive_burst=int(os.getenv('UPSTREAM_INTERACTIVE_BURST', '40'))
+)
+
+registry.collect(
+    'upstream_scheduler', 'Upstream scheduler state: active calls, waiting callers, free tokens',
+    'gauge', ('state',),
+    lambda: [((name,), value) for name, value in scheduler.stats().items()])
@@ -1,5 +1,5 @@
-import React, { useState, useEffect } from 'react';
-import { fetchStockData } from '../utils/api';
+import React, { useState, useEffect, useRef } from 'react';
+import { fetchStockData, subscribeQuotes } from '../utils/api';
 import StockChart from '../components/StockChart';
 import { Link } from 'react-router-dom';
 
@@ -17,8 +17,11 @@ const periodMap = {
 function StockTracker() {
   const [symbol, setSymbol] = useState('');
   const [stockData, setStockData] = useState(null);
+  const [info, setInfo] = useState(null);
+  const infoSymbol = useRef(null);
   const [period, setPeriod] = useState('1d');
   const [loading, setLoading] = useState(false);
+  const [livePrice, setLivePrice] = useState(null);
 
   const loadStockData = async () => {
     if (!symbol) return;
@@ -26,7 +29,13 @@ function StockTracker() {
     setLoading(true);
     try {
       const { period: p, interval } = periodMap[period];
-      const data = await fetchStockData(symbol, p, interval);
+      // Period switches only need new prices; info is fetched once per symbol
+      const needInfo = infoSymbol.current !== symbol;
+      const data = await fetchStockData(symbol, p, interval, needInfo);
+      if (needInfo) {
+        infoSymbol.current = symbol;
+        setInfo(data.info);
+      }
       setStockData(data);
     } catch (error) {
       console.error('Error fetching stock data:', error);
@@ -40,6 +49,12 @@ function StockTracker() {
     }
   }, [symbol, period]);
 
+  useEffect(() => {
+    setLivePrice(null);
+    if (!symbol) return;
+    return subscribeQuotes([symbol], (quote) => setLivePrice(quote.price));
+  }, [symbol]);
+
   return (
     <div className="container mt-5">
       <h2>Stock Tracker</h2>
@@ -67,11 +82,11 @@ function StockTracker() {
 
       {loading && <div>Loading...</div>}
       
-      {stockData && stockData.info && (
+      {stockData && info && (
         <div>
           <div className="mb-3">
-            <h3>{stockData.info.longName || symbol}</h3>
-            <p>Current Price: ${stockData.info.currentPrice || stockData.info.regularMarketPrice || stockData.prices[stockData.prices.length - 1]?.toFixed(2) || 'N/A'}</p>
+            <h3>{info.longName || symbol}</h3>
+            <p>Current Price: ${livePrice?.toFixed(2) || info.currentPrice || info.regularMarketPrice || stockData.prices[stockData.prices.length - 1]?.toFixed(2) || 'N/A'}</p>
           </div>
           <StockChart stockData={stockData} symbol={symbol} />
         </div>
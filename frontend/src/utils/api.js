@@ -10,30 +10,22 @@ const api = axios.create({
 
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token');
-  console.log('Request URL:', config.url);
-  console.log('Token present:', !!token);
   if (token) {
     config.headers.Authorization = `Bearer ${token}`;
-    console.log('Authorization header set:', config.headers.Authorization);
   }
   return config;
-}, (error) => {
-  console.error('Request interceptor error:', error);
-  return Promise.reject(error);
-});
+}, (error) => Promise.reject(error));
 
 // Add response interceptor to handle token expiration and invalid tokens
 api.interceptors.response.use(
   (response) => response,
   (error) => {
-    console.error('API Error:', {
-      status: error.response?.status,
-      data: error.response?.data,
-      config: error.config
-    });
+    // Per-call error detail is only useful while developing
+    if (import.meta.env.DEV) {
+      console.error('API Error:', error.config?.url, error.response?.status, error.response?.data);
+    }
     
     if (error.response?.status === 422) {
-      console.log('Token error:', error.response?.data);
       // Clear token and redirect to login for any token-related errors
       localStorage.removeItem('token');
       window.location.href = '/login';
@@ -42,19 +34,62 @@ api.interceptors.response.use(
   }
 );
 
-export const fetchStockData = async (symbol, period, interval) => {
+// Charts are a few hundred pixels wide; the server keeps each bucket's extremes
+const CHART_POINTS = 500;
+
+// Decode a series from a format=compact chart response
+const decodeSeries = (series) => {
+  if (series.encoding === 'float32') {
+    const bytes = Uint8Array.from(atob(series.data), (c) => c.charCodeAt(0));
+    return Array.from(new Float32Array(bytes.buffer));
+  }
+  let total = 0;
+  return series.values.map((delta) => (total += delta) / series.scale);
+};
+
+// Rebuild date labels from t0/dt epoch seconds in the exchange time zone
+const decodeDates = ({ t0, dt, tz }, withTime) => {
+  const format = new Intl.DateTimeFormat('en-CA', {
+    timeZone: tz,
+    year: 'numeric',
+    month: '2-digit',
+    day: '2-digit',
+    ...(withTime ? { hour: '2-digit', minute: '2-digit', hourCycle: 'h23' } : {})
+  });
+  let t = t0;
+  return dt.map((step) => format.format(new Date((t += step) * 1000)));
+};
+
+// info is large and doesn't change with the period, so ask for it only once per symbol
+export const fetchStockData = async (symbol, period, interval, withInfo = false) => {
   try {
-    const response = await api.get(`/api/stock/${symbol}?period=${period}&interval=${interval}`);
-    return response.data;
+    const fields = withInfo ? 'prices,dates,info' : 'prices,dates';
+    const response = await api.get(
+      `/api/stock/${symbol}?period=${period}&interval=${interval}&format=compact&fields=${fields}&points=${CHART_POINTS}`
+    );
+    const data = response.data;
+    return {
+      info: data.info,
+      prices: decodeSeries(data.prices),
+      dates: decodeDates(data, /[mh]$/.test(interval))
+    };
   } catch (error) {
     throw error;
   }
 };
 
+// Subscribe to live price changes; returns a function that closes the stream
+export const subscribeQuotes = (symbols, onQuote) => {
+  const source = new EventSource(
+    `${import.meta.env.VITE_API_URL}/api/stream/quotes?symbols=${symbols.join(',')}`
+  );
+  source.onmessage = (event) => onQuote(JSON.parse(event.data));
+  return () => source.close();
+};
+
 export const fetchPortfolio = async () => {
   try {
     const response = await api.get('/api/portfolio');
-    console.log('Portfolio API response:', response.data);
     return response.data;
   } catch (error) {
     console.error('Portfolio API error:', error.response?.data || error);
@@ -84,14 +119,31 @@ export const fetchDashboardData = async (symbol) => {
 
 export const fetchComparisonData = async (symbol, period) => {
   try {
-    const response = await api.get(`/api/comparison/${symbol}?period=${period}`);
-    return response.data;
+    const response = await api.get(`/api/comparison/${symbol}?period=${period}&format=compact&points=${CHART_POINTS}`);
+    const { t0, dt, tz, stock_prices, stock_performance, sp500_performance, ...summary } = response.data;
+    return {
+      ...summary,
+      dates: decodeDates({ t0, dt, tz }, period === '1d' || period === '5d'),
+      stock_prices: decodeSeries(stock_prices),
+      stock_performance: decodeSeries(stock_performance),
+      sp500_performance: decodeSeries(sp500_performance)
+    };
   } catch (error) {
     console.error('Comparison data API error:', error.response?.data || error);
     throw error;
   }
 };
 
+export const fetchMultiComparisonData = async (symbols, period) => {
+  try {
+    const response = await api.get(`/api/comparison?symbols=${symbols.join(',')}&period=${period}&points=${CHART_POINTS}`);
+    return response.data;
+  } catch (error) {
+    console.error('Multi comparison data API error:', error.response?.data || error);
+    throw error;
+  }
+};
+
 export const searchSymbols = async (query) => {
   try {
     const response = await api.get(`/api/search?q=${query}`);
@@ -104,17 +156,14 @@ export const searchSymbols = async (query) => {
 
 export const login = async (credentials) => {
   try {
-    console.log('Attempting login with:', credentials.email);
     const response = await api.post('/api/login', credentials);
-    console.log('Login response:', response.data);
     
     // Handle both token and access_token formats
     const token = response.data.token || response.data.access_token;
     if (token) {
       localStorage.setItem('token', token);
-      console.log('Token stored successfully');
     } else {
-      console.error('No token in response:', response.data);
+      console.error('No token in login response');
     }
     return response.data;
   } catch (error) {
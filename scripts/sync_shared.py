@@ -0,0 +1,51 @@
+"""Keep the modules both services deploy in step.
+
+backend/ and backend-datahandle/ are deployed separately, so each ships its
+own copy of the shared modules. backend/ holds the source of truth; edit the
+module there and run
+
+    python scripts/sync_shared.py            # copy to backend-datahandle/
+    python scripts/sync_shared.py --check    # exit 1 if any copy differs
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE = os.path.join(ROOT, 'backend')
+COPIES = [os.path.join(ROOT, 'backend-datahandle')]
+
+SHARED_MODULES = (
+    'bar_store.py', 'chart_payload.py', 'compression.py', 'fake_upstream.py',
+    'lazy.py', 'market_hours.py', 'metrics.py', 'upstream.py',
+)
+
+
+def differing():
+    """(module, copy directory) pairs whose copy doesn't match the source"""
+    return [(module, directory) for directory in COPIES for module in SHARED_MODULES
+            if not os.path.exists(os.path.join(directory, module))
+            or not filecmp.cmp(os.path.join(SOURCE, module), os.path.join(directory, module), shallow=False)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Copy or check the shared service modules')
+    parser.add_argument('--check', action='store_true', help='Only report copies that differ')
+    args = parser.parse_args()
+
+    stale = differing()
+    for module, directory in stale:
+        target = os.path.join(directory, module)
+        if args.check:
+            print(f"{os.path.relpath(target, ROOT)} differs from backend/{module}")
+        else:
+            shutil.copyfile(os.path.join(SOURCE, module), target)
+            print(f"Updated {os.path.relpath(target, ROOT)}")
+    if args.check and stale:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()